@@ -5,74 +5,1164 @@ import json
 import logging
 import os
 import io
-from flask import Flask, request, abort, render_template_string
+from flask import Flask, request, abort, send_file, g
+from jinja2 import Environment, DictLoader, FileSystemBytecodeCache
 import threading
+import aiohttp
+from aiohttp import web
 import secrets
 from datetime import datetime, timedelta
 import re
+import time
+import sqlite3
+import asyncio
+import gzip
+import hashlib
+import functools
+import contextvars
+import sys
+import traceback
+from collections import OrderedDict
 
 # Set up logging for debugging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 # Configure bot intents
-intents = discord.Intents.default()
-intents.message_content = True
-intents.members = True
-client = commands.Bot(command_prefix=None, intents=intents)
+# "default" subscribes to discord.py's default gateway events. "low_traffic" subscribes only to what
+# the ticket flows use, so large servers stop streaming every message, reaction and typing event
+# to the bot. Transcripts read ticket channels through the REST history endpoint, which needs no
+# message events.
+GATEWAY_MODE = "default"
+# Message content is a privileged intent. Without it Discord returns empty content for messages in
+# transcripts (except ones that mention the bot), and the transcript page notes that content is missing.
+MESSAGE_CONTENT_INTENT = True
+if GATEWAY_MODE == "low_traffic":
+    intents = discord.Intents.none()
+    intents.guilds = True
+else:
+    intents = discord.Intents.default()
+intents.message_content = MESSAGE_CONTENT_INTENT
+
+# Member cache. "full" enables the members intent and caches every member of every guild, chunked
+# at startup. "lazy" turns both off: members are looked up when a ticket needs them (see
+# MemberResolver), so memory and startup time follow ticket activity instead of guild size.
+MEMBER_CACHE_MODE = "full"
+MEMBER_CACHE_SIZE = 5000  # Fetched members kept in the resolver's LRU
+MEMBER_CACHE_TTL = 600  # Seconds a fetched member (or a miss) is reused before fetching again
+intents.members = MEMBER_CACHE_MODE == "full"
+
+# Sharding. With SHARD_COUNT None Discord recommends the shard count and this process runs them all.
+# To split the bot over several processes, give each the same SHARD_COUNT and its own SHARD_IDS;
+# a process then only loads and writes tickets, panels and jobs for guilds on its shards.
+# Running a shard range needs the SQLite ticket store, which all processes share.
+SHARD_COUNT = None
+SHARD_IDS = None  # e.g. [0, 1]; None runs every shard
+client = commands.AutoShardedBot(
+    command_prefix=None,
+    intents=intents,
+    shard_count=SHARD_COUNT,
+    shard_ids=SHARD_IDS,
+    chunk_guilds_at_startup=MEMBER_CACHE_MODE == "full",
+    # No message events arrive in low-traffic mode, so there is nothing to cache
+    max_messages=None if GATEWAY_MODE == "low_traffic" else 1000,
+    member_cache_flags=discord.MemberCacheFlags.from_intents(intents)
+)
+
+def shard_filter_sql(column):
+    # SQL condition matching the rows for guilds owned by this process: those on its shards, plus
+    # tickets from before guild ids were recorded, which every process loads
+    if SHARD_IDS is None:
+        return "1", ()
+    placeholders = ", ".join("?" for _ in SHARD_IDS)
+    return f"({column} IS NULL OR ({column} >> 22) % ? IN ({placeholders}))", (SHARD_COUNT, *SHARD_IDS)
+
+def is_primary_process():
+    # The process running shard 0 also syncs commands and serves transcripts
+    return SHARD_IDS is None or 0 in SHARD_IDS
 
 # Flask setup for web server
 app = Flask(__name__)
-# Store transcripts and tokens in memory (cleared on bot restart)
-transcripts = {}
-tokens = {}
+# Transcripts are archived on disk so links survive restarts, and served as pre-rendered pages
+TRANSCRIPT_DIR = "transcripts"
+TRANSCRIPT_INDEX_CACHE_SIZE = 10000  # Index entries of recently viewed transcripts kept in memory
+# Seconds browsers may cache a transcript page; pages never change once rendered
+TRANSCRIPT_MAX_AGE = 86400
+# Transcript web server: "flask" (Werkzeug dev server on its own thread) or "aiohttp"
+# (served from the bot's event loop, suited to many concurrent viewers)
+TRANSCRIPT_SERVER_BACKEND = "flask"
+TRANSCRIPT_SERVER_MAX_CONCURRENT_REQUESTS = 1000
+TRANSCRIPT_SERVER_KEEPALIVE_TIMEOUT = 75
+
+# Prometheus metrics, served as text at /metrics on the transcript web server
+METRICS_ENABLED = True
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+class Metric:
+    # One metric family; samples are keyed by their label values. Updated from the event loop, the
+    # persistence thread and the Flask thread, hence the lock.
+    def __init__(self, name, help_text, kind, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.kind = kind
+        self.labelnames = labelnames
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            for key, value in self.values.items():
+                lines.append(f"{self.name}{self._labels(key)} {value}")
+        return lines
+
+class Counter(Metric):
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, "counter", labelnames)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    # Either set() directly or read from a callback at scrape time
+    def __init__(self, name, help_text, labelnames=(), callback=None):
+        super().__init__(name, help_text, "gauge", labelnames)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def render(self):
+        if self.callback is not None:
+            try:
+                value = self.callback()
+            except Exception as e:
+                logger.error(f"Failed to read metric {self.name}: {str(e)}")
+                return []
+            with self.lock:
+                self.values = {(): value}
+        return super().render()
+
+class Histogram(Metric):
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, "histogram", labelnames)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            sample = self.values.get(key)
+            if sample is None:
+                sample = self.values[key] = [[0] * len(self.buckets), 0.0, 0]  # bucket counts, sum, count
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    sample[0][i] += 1
+            sample[1] += value
+            sample[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, (counts, total, count) in self.values.items():
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{self._labels(key, [('le', bound)])} {bucket_count}")
+                lines.append(f"{self.name}_bucket{self._labels(key, [('le', '+Inf')])} {count}")
+                lines.append(f"{self.name}_sum{self._labels(key)} {total}")
+                lines.append(f"{self.name}_count{self._labels(key)} {count}")
+        return lines
+
+    def time(self, **labels):
+        return HistogramTimer(self, labels)
+
+class HistogramTimer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+metrics = []
+
+def register_metric(metric):
+    metrics.append(metric)
+    return metric
+
+def render_metrics():
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+def timed(histogram, **labels):
+    # Decorator recording an async handler's duration, whether it returns or raises
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with histogram.time(**labels):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+TICKET_OPERATION_SECONDS = register_metric(Histogram("ticket_operation_seconds", "Time to handle a ticket create, claim or close", ("operation",)))
+TRANSCRIPT_GENERATION_SECONDS = register_metric(Histogram("transcript_generation_seconds", "Time to fetch and write a ticket transcript"))
+TRANSCRIPT_MESSAGES = register_metric(Counter("transcript_messages_total", "Messages written to transcripts"))
+TRANSCRIPT_BYTES = register_metric(Counter("transcript_bytes_total", "Uncompressed bytes written to transcripts"))
+TRANSCRIPT_MESSAGES_PER_SECOND = register_metric(Gauge("transcript_messages_per_second", "Message throughput of the most recent transcript"))
+PERSIST_WRITE_SECONDS = register_metric(Histogram("persistence_write_seconds", "Time to write a batch of ticket, counter and panel changes"))
+LOG_QUEUE_DELAY_SECONDS = register_metric(Histogram("log_queue_delay_seconds", "Time a log entry waits between log_action and being sent"))
+LOG_SEND_SECONDS = register_metric(Histogram("log_send_seconds", "Time to send one batch of log entries"))
+LOG_ENTRIES = register_metric(Counter("log_entries_total", "Log entries sent to or dropped by the log channel queues", ("outcome",)))
+DISCORD_RATE_LIMITS = register_metric(Counter("discord_http_rate_limited_total", "HTTP 429 responses from the Discord API"))
+TRANSCRIPT_HTTP_REQUESTS = register_metric(Counter("transcript_http_requests_total", "Transcript web server requests", ("status",)))
+TRANSCRIPT_HTTP_SECONDS = register_metric(Histogram("transcript_http_request_seconds", "Transcript web server response time"))
+# Gauges read at scrape time from the bot's own state
+register_metric(Gauge("open_tickets", "Tickets that are open right now", callback=lambda: len(open_tickets_by_user)))
+register_metric(Gauge("transcript_bytes_in_progress", "Bytes written so far by transcripts still being generated", callback=lambda: sum(writer.bytes_written for writer in list(transcript_archive.active_writers))))
+register_metric(Gauge("close_jobs_pending", "Ticket close jobs waiting or running", callback=lambda: len(job_queue.pending)))
+register_metric(Gauge("log_queue_depth", "Log entries waiting to be sent", callback=lambda: sum(log_queue.queue.qsize() for log_queue in list(log_queues.values()))))
+
+class RateLimitCounter(logging.Handler):
+    # discord.py retries 429s internally and only reports them through its log, one warning per 429
+    def emit(self, record):
+        if isinstance(record.msg, str) and record.msg.startswith("We are being rate limited"):
+            DISCORD_RATE_LIMITS.inc()
+
+logging.getLogger("discord.http").addHandler(RateLimitCounter(logging.WARNING))
+
+# Event-loop stall detection. A heartbeat on the loop records when it last ran; a watchdog thread
+# notices when it stops and logs the loop thread's stack while it is still blocked.
+LOOP_WATCHDOG_ENABLED = False
+LOOP_WATCHDOG_INTERVAL = 0.1  # Seconds between heartbeats
+LOOP_STALL_THRESHOLD = 0.5  # Seconds of lag before the blocking stack is logged
+SLOW_HANDLER_THRESHOLD = 2.0  # Commands and buttons slower than this are logged as warnings
+
+EVENT_LOOP_LAG_SECONDS = register_metric(Histogram("event_loop_lag_seconds", "How late the event loop ran the watchdog heartbeat"))
+HANDLER_SECONDS = register_metric(Histogram("handler_seconds", "Wall time of slash commands and button callbacks", ("handler",)))
+HANDLER_API_CALLS = register_metric(Counter("handler_api_calls_total", "Discord API calls made by slash commands and button callbacks", ("handler",)))
+
+class LoopWatchdog:
+    def __init__(self):
+        self.last_beat = None
+        self.loop_thread_id = None
+        self.stalled = False
+        self.task = None
+
+    def start(self):
+        self.loop_thread_id = threading.get_ident()
+        self.last_beat = time.monotonic()
+        # Kept so the heartbeat task is not garbage collected while it runs
+        self.task = asyncio.create_task(self.heartbeat())
+        threading.Thread(target=self.watch, name="loop-watchdog", daemon=True).start()
+
+    async def heartbeat(self):
+        while True:
+            expected = time.monotonic() + LOOP_WATCHDOG_INTERVAL
+            await asyncio.sleep(LOOP_WATCHDOG_INTERVAL)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            EVENT_LOOP_LAG_SECONDS.observe(lag)
+            self.last_beat = now
+            if self.stalled:
+                self.stalled = False
+                logger.warning(f"Event loop resumed after being blocked for {lag:.2f}s")
+
+    def watch(self):
+        while True:
+            time.sleep(LOOP_WATCHDOG_INTERVAL)
+            lag = time.monotonic() - self.last_beat - LOOP_WATCHDOG_INTERVAL
+            if lag > LOOP_STALL_THRESHOLD and not self.stalled:
+                # One sample per stall, taken while the blocking code is still on the stack
+                self.stalled = True
+                frame = sys._current_frames().get(self.loop_thread_id)
+                stack = "".join(traceback.format_stack(frame)) if frame else "unavailable\n"
+                logger.warning(f"Event loop blocked for {lag:.2f}s, loop thread stack:\n{stack}")
+
+loop_watchdog = LoopWatchdog()
+
+# Per-handler profiling. API calls are counted where they leave the bot's HTTP client; interaction
+# responses and followups go through the interaction webhook and are not included.
+handler_api_calls = contextvars.ContextVar("handler_api_calls", default=None)
+
+def profiled(name, operation=None):
+    # Ticket create, claim and close handlers also pass their operation, so the one measurement
+    # feeds ticket_operation_seconds as well as handler_seconds
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            api_calls = [0]
+            token = handler_api_calls.set(api_calls)
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                handler_api_calls.reset(token)
+                HANDLER_SECONDS.observe(elapsed, handler=name)
+                if operation is not None:
+                    TICKET_OPERATION_SECONDS.observe(elapsed, operation=operation)
+                HANDLER_API_CALLS.inc(api_calls[0], handler=name)
+                if elapsed > SLOW_HANDLER_THRESHOLD:
+                    logger.warning(f"Slow handler {name}: {elapsed:.2f}s, {api_calls[0]} API calls")
+                else:
+                    logger.debug(f"Handler {name}: {elapsed:.3f}s, {api_calls[0]} API calls")
+        return wrapper
+    return decorator
+
+def count_api_calls(request):
+    @functools.wraps(request)
+    async def counted_request(*args, **kwargs):
+        api_calls = handler_api_calls.get()
+        if api_calls is not None:
+            api_calls[0] += 1
+        return await request(*args, **kwargs)
+    return counted_request
+
+client.http.request = count_api_calls(client.http.request)
+
+class TranscriptWriter:
+    # Writes a transcript as gzipped JSON lines ({"author": ...} records, each ahead of the first
+    # {"message": ...} that refers to it, then one {"stats": ...}), naming the finished file after
+    # the SHA-256 of its contents
+    def __init__(self, archive):
+        self.archive = archive
+        self.tmp_path = os.path.join(archive.directory, f".{secrets.token_hex(8)}.tmp")
+        self.file = gzip.open(self.tmp_path, "wt", encoding="utf-8")
+        self.hash = hashlib.sha256()
+        self.bytes_written = 0
+        archive.active_writers.add(self)
+
+    def _write(self, record):
+        line = json.dumps(record) + "\n"
+        encoded = line.encode("utf-8")
+        self.hash.update(encoded)
+        self.bytes_written += len(encoded)
+        self.file.write(line)
+
+    def write_author(self, author):
+        self._write({"author": author})
+
+    def write_message(self, message):
+        self._write({"message": message})
+
+    def finish(self, stats):
+        self._write({"stats": stats})
+        self.file.close()
+        digest = self.hash.hexdigest()
+        os.replace(self.tmp_path, self.archive.path_for(digest))
+        self.archive.active_writers.discard(self)
+        TRANSCRIPT_BYTES.inc(self.bytes_written)
+        return digest
+
+    def abort(self):
+        self.archive.active_writers.discard(self)
+        self.file.close()
+        try:
+            os.remove(self.tmp_path)
+        except FileNotFoundError:
+            pass
+
+class ArchivedTranscript:
+    # Reads an archived transcript lazily. Iterate .messages once; .authors fills in as it goes
+    # and .stats is filled in when the iteration reaches the trailing stats record.
+    def __init__(self, path):
+        self.path = path
+        self.authors = {}
+        self.stats = {}
+
+    @property
+    def messages(self):
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if "message" in record:
+                    yield record["message"]
+                elif "author" in record:
+                    self.authors[record["author"]["id"]] = record["author"]
+                elif "stats" in record:
+                    self.stats = record["stats"]
+
+class TranscriptArchive:
+    # Transcript files live in the archive directory. The index mapping ticket numbers to files and
+    # access tokens is a table in the ticket database, one row per ticket, and entries are looked up
+    # when a link is opened, so processes running other shard ranges see each other's transcripts.
+    # The table is used whichever ticket store backend is configured, hence its own connection.
+    def __init__(self, directory, db_path):
+        self.directory = directory
+        self.active_writers = set()  # Transcripts being generated, for the in-progress bytes gauge
+        os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS transcripts (ticket_number TEXT PRIMARY KEY, digest TEXT NOT NULL, "
+            "token TEXT NOT NULL, creator_id INTEGER, html TEXT)"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+        self.lock = threading.Lock()
+        # LRU of index entries, so repeat views of a transcript skip the database. Its own lock keeps
+        # cache hits from waiting on a query. Entries only change when a ticket is closed again.
+        self.cache = OrderedDict()  # ticket number -> entry
+        self.cache_lock = threading.Lock()
+        self.migrate_index_file(os.path.join(directory, "index.jsonl"))
+
+    def migrate_index_file(self, index_path):
+        # One-shot import of the index.jsonl the archive used to append to; it is left in place as a backup.
+        # BEGIN IMMEDIATE keeps two processes starting together from importing over each other's new entries.
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                if not self.conn.execute("SELECT 1 FROM meta WHERE key = 'transcript_index_migrated'").fetchone():
+                    entries = {}
+                    try:
+                        with open(index_path, "r") as f:
+                            for line in f:
+                                if line.strip():
+                                    entry = json.loads(line)
+                                    entries[entry["ticket_number"]] = entry  # Later lines win
+                    except FileNotFoundError:
+                        pass
+                    self.conn.executemany(
+                        "INSERT OR REPLACE INTO transcripts (ticket_number, digest, token, creator_id, html) VALUES (?, ?, ?, ?, ?)",
+                        [(number, entry["digest"], entry["token"], entry.get("creator_id"), entry.get("html")) for number, entry in entries.items()]
+                    )
+                    self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('transcript_index_migrated', ?)", (discord.utils.utcnow().isoformat(),))
+                    if entries:
+                        logger.info(f"Migrated {len(entries)} transcript index entries from {index_path}")
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def path_for(self, digest):
+        return os.path.join(self.directory, f"{digest}.jsonl.gz")
+
+    def html_path_for(self, digest, gzipped=False):
+        return os.path.join(self.directory, f"{digest}.html.gz" if gzipped else f"{digest}.html")
+
+    def writer(self):
+        return TranscriptWriter(self)
+
+    def add(self, ticket_number, digest, token, creator_id):
+        # A reopened ticket that is closed again replaces its previous transcript and token
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO transcripts (ticket_number, digest, token, creator_id, html) VALUES (?, ?, ?, ?, NULL)",
+                (str(ticket_number), digest, token, creator_id)
+            )
+        self.cache_entry(ticket_number, {"digest": digest, "token": token, "creator_id": creator_id, "html": None})
+
+    def cache_entry(self, ticket_number, entry):
+        with self.cache_lock:
+            self.cache[str(ticket_number)] = entry
+            self.cache.move_to_end(str(ticket_number))
+            while len(self.cache) > TRANSCRIPT_INDEX_CACHE_SIZE:
+                self.cache.popitem(last=False)
+
+    def cached_entry(self, ticket_number):
+        with self.cache_lock:
+            entry = self.cache.get(str(ticket_number))
+            if entry is not None:
+                self.cache.move_to_end(str(ticket_number))
+            return entry
+
+    def load_entry(self, ticket_number):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT digest, token, creator_id, html FROM transcripts WHERE ticket_number = ?", (str(ticket_number),)
+            ).fetchone()
+        if row is None:
+            return None
+        entry = {"digest": row[0], "token": row[1], "creator_id": row[2], "html": row[3]}
+        self.cache_entry(ticket_number, entry)
+        return entry
+
+    def entry(self, ticket_number):
+        return self.cached_entry(ticket_number) or self.load_entry(ticket_number)
+
+    def authorized_entry(self, ticket_number, token, cached_only=False):
+        # The entry for a transcript link, or None if the token does not match. A cached entry with
+        # another token is read again, in case another process re-archived the ticket after a reopen.
+        # cached_only answers from the cache alone and returns None when the database is needed.
+        if not token:
+            return None
+        entry = self.cached_entry(ticket_number)
+        if not entry or not secrets.compare_digest(entry["token"], token):
+            if cached_only:
+                return None
+            entry = self.load_entry(ticket_number)
+        if not entry or not secrets.compare_digest(entry["token"], token):
+            return None
+        return entry
+
+    def open(self, ticket_number):
+        entry = self.entry(ticket_number)
+        return ArchivedTranscript(self.path_for(entry["digest"])) if entry else None
+
+    def render_html(self, ticket_number):
+        # Renders the transcript page once, as plain and pre-gzipped static files named by their hash
+        entry = self.entry(ticket_number)
+        transcript = self.open(ticket_number)
+        if not transcript:
+            raise FileNotFoundError(f"No transcript archived for ticket {ticket_number}")
+        tmp_path = os.path.join(self.directory, f".{secrets.token_hex(8)}.tmp")
+        digest = hashlib.sha256()
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as html_file, gzip.open(f"{tmp_path}.gz", "wt", encoding="utf-8") as gz_file:
+                for chunk in render_transcript_chunks(ticket_number, transcript):
+                    digest.update(chunk.encode("utf-8"))
+                    html_file.write(chunk)
+                    gz_file.write(chunk)
+            html_digest = digest.hexdigest()
+            os.replace(tmp_path, self.html_path_for(html_digest))
+            os.replace(f"{tmp_path}.gz", self.html_path_for(html_digest, gzipped=True))
+        finally:
+            for path in (tmp_path, f"{tmp_path}.gz"):
+                if os.path.exists(path):
+                    os.remove(path)
+        with self.lock, self.conn:
+            # Only if the ticket has not been re-archived under a new transcript in the meantime
+            updated = self.conn.execute(
+                "UPDATE transcripts SET html = ? WHERE ticket_number = ? AND digest = ?",
+                (html_digest, str(ticket_number), entry["digest"])
+            ).rowcount
+        if updated:
+            self.cache_entry(ticket_number, {**entry, "html": html_digest})
+        return html_digest
 
 # Ticket system variables
 TICKET_COUNTER_FILE = "ticket_counter.json"
 TICKET_DATA_FILE = "ticket_data.json"
 SUPPORT_PANEL_FILE = "support_panel.json"
+GUILD_SETTINGS_FILE = "guild_settings.json"
+# Per-guild tables (guild id -> JSON value) and the files the JSON store keeps them in
+GUILD_TABLE_FILES = {"panels": SUPPORT_PANEL_FILE, "guild_settings": GUILD_SETTINGS_FILE}
+# Where ticket data lives: "sqlite" (default) or "json" (whole-file rewrites, fine for tiny servers)
+TICKET_STORE_BACKEND = "sqlite"
+TICKET_DB_FILE = "tickets.db"
+
+# Writes go through a background worker (see PersistenceWorker) that coalesces bursts of changes
+PERSIST_INTERVAL = 0.5  # Seconds to collect changes before writing them out together
+
+# Ticket close work (transcript, archive, log, DM) runs as durable jobs (see JobQueue)
+JOB_DB_FILE = TICKET_DB_FILE
+JOB_WORKERS = 4  # Jobs processed at once; a mass close queues up instead of flooding the event loop
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_BASE_DELAY = 5  # Seconds before the first retry; doubles with every failed attempt
+
+transcript_archive = TranscriptArchive(TRANSCRIPT_DIR, TICKET_DB_FILE)
+
+def write_file_atomic(path, text):
+    # Temp file + fsync + rename, so a crash mid-write never leaves a truncated file behind
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
 
 # Load and save ticket counter
 def load_ticket_counter():
+    return ticket_store.load_counter()
+
+def save_ticket_counter(counter):
+    persistence.mark_counter()
+
+def load_counter_file():
     try:
         with open(TICKET_COUNTER_FILE, "r") as f:
             counter = json.load(f).get("counter", 0)
             return counter
     except FileNotFoundError:
-        save_ticket_counter(0)
         return 0
 
-def save_ticket_counter(counter):
-    with open(TICKET_COUNTER_FILE, "w") as f:
-        json.dump({"counter": counter}, f)
-
-# Load and save ticket data
-def load_ticket_data():
+def load_guild_table_file(table):
     try:
-        with open(TICKET_DATA_FILE, "r") as f:
+        with open(GUILD_TABLE_FILES[table], "r") as f:
             return json.load(f)
     except FileNotFoundError:
         return {}
 
-def save_ticket_data(data):
-    with open(TICKET_DATA_FILE, "w") as f:
-        json.dump(data, f)
+# Ticket stores. snapshot() runs on the event loop and copies what needs writing (the ticket numbers
+# that changed, or everything when ticket_numbers is None); write() then runs off the loop.
+# A number that is no longer in the dict means the ticket was deleted.
+class JsonTicketStore:
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def snapshot(self, data, ticket_numbers=None):
+        # JSON has no rows, so every write rewrites the whole file
+        return True, {number: dict(info) for number, info in data.items()}
+
+    def write(self, snapshot):
+        write_file_atomic(self.path, json.dumps(snapshot[1]))
+
+    def save(self, data, ticket_number=None):
+        self.write(self.snapshot(data))
+
+    def load_counter(self):
+        # The files are written one after another, so a crash can leave the counter file behind
+        # the tickets file; never restart below a ticket number that is already taken
+        return max([load_counter_file(), *(int(number) for number in self.load() if number.isdigit())])
+
+    def write_counter(self, counter):
+        write_file_atomic(TICKET_COUNTER_FILE, json.dumps({"counter": counter}))
+
+    def load_guild_table(self, table):
+        return load_guild_table_file(table)
+
+    def snapshot_guild_table(self, table, rows):
+        return json.dumps(rows)
+
+    def write_guild_table(self, table, snapshot):
+        write_file_atomic(GUILD_TABLE_FILES[table], snapshot)
+
+    def write_all(self, snapshot):
+        # Separate files cannot be replaced together. The counter goes first, so after a crash it can
+        # only be ahead of the tickets, and load_counter covers the other case anyway.
+        if "counter" in snapshot:
+            self.write_counter(snapshot["counter"])
+        if "tickets" in snapshot:
+            self.write(snapshot["tickets"])
+        for table in GUILD_TABLE_FILES:
+            if table in snapshot:
+                self.write_guild_table(table, snapshot[table])
+
+class SqliteTicketStore:
+    def __init__(self, path):
+        # The connection is shared by the event loop, the persistence worker and ticket allocation
+        # threads, so every use of it holds self.lock (reentrant: save() calls write()).
+        # Processes running other shard ranges share the file; each touches only its own guilds' rows.
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS tickets (ticket_number TEXT PRIMARY KEY, data TEXT NOT NULL, guild_id INTEGER)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        for table in GUILD_TABLE_FILES:
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (guild_id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        if add_column_if_missing(self.conn, "tickets", "guild_id", "INTEGER"):
+            self.conn.execute("UPDATE tickets SET guild_id = json_extract(data, '$.guild_id')")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS tickets_guild_id ON tickets (guild_id)")
+        self.conn.commit()
+
+    def load(self):
+        with self.lock:
+            condition, params = shard_filter_sql("guild_id")
+            return {ticket_number: json.loads(data) for ticket_number, data in self.conn.execute(f"SELECT ticket_number, data FROM tickets WHERE {condition}", params)}
+
+    def snapshot(self, data, ticket_numbers=None):
+        if ticket_numbers is None:
+            return True, {str(number): (info.get("guild_id"), json.dumps(info)) for number, info in data.items()}
+        return False, {
+            str(number): (data[str(number)].get("guild_id"), json.dumps(data[str(number)])) if str(number) in data else None
+            for number in ticket_numbers
+        }
+
+    def write(self, snapshot):
+        with self.lock, self.conn:
+            self._write_tickets(snapshot)
+
+    def _write_tickets(self, snapshot):
+        replace_all, rows = snapshot
+        if replace_all:
+            # Only this process's guilds; other shard ranges' tickets are left alone
+            condition, params = shard_filter_sql("guild_id")
+            self.conn.execute(f"DELETE FROM tickets WHERE {condition}", params)
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO tickets (ticket_number, guild_id, data) VALUES (?, ?, ?)",
+            ((number, row[0], row[1]) for number, row in rows.items() if row is not None)
+        )
+        self.conn.executemany(
+            "DELETE FROM tickets WHERE ticket_number = ?",
+            ((number,) for number, row in rows.items() if row is None)
+        )
+
+    def write_all(self, snapshot):
+        # Everything one persistence pass collected commits in a single transaction, so a crash can
+        # never leave the stored counter behind the stored tickets
+        with self.lock, self.conn:
+            if "tickets" in snapshot:
+                self._write_tickets(snapshot["tickets"])
+            if "counter" in snapshot:
+                self._write_counter(snapshot["counter"])
+            for table in GUILD_TABLE_FILES:
+                if table in snapshot:
+                    self._write_guild_table(table, snapshot[table])
+
+    def save(self, data, ticket_number=None):
+        self.write(self.snapshot(data, None if ticket_number is None else [ticket_number]))
+
+    def migrate_from_json(self, json_path):
+        with self.lock:
+            # One-shot import of the legacy JSON files; they are left in place as a backup
+            if not self.conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+                if os.path.exists(json_path):
+                    data = JsonTicketStore(json_path).load()
+                    self.save(data)
+                    logger.info(f"Migrated {len(data)} tickets from {json_path} to {TICKET_DB_FILE}")
+                with self.conn:
+                    self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', ?)", (discord.utils.utcnow().isoformat(),))
+            if not self.conn.execute("SELECT 1 FROM meta WHERE key = 'ticket_counter'").fetchone():
+                self.write_counter(load_counter_file())
+            if not self.conn.execute("SELECT 1 FROM meta WHERE key = 'panels_migrated'").fetchone():
+                self.write_guild_table("panels", self.snapshot_guild_table("panels", load_guild_table_file("panels")))
+                with self.conn:
+                    self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('panels_migrated', ?)", (discord.utils.utcnow().isoformat(),))
+
+    def load_counter(self):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'ticket_counter'").fetchone()
+            counter = int(row[0]) if row else 0
+            # Databases written before the counter and tickets were committed together can have the
+            # counter behind the highest ticket; catch it up so that number is not handed out again
+            highest = self.conn.execute("SELECT COALESCE(MAX(CAST(ticket_number AS INTEGER)), 0) FROM tickets").fetchone()[0]
+            if highest > counter:
+                logger.warning(f"Stored ticket counter {counter} is behind ticket {highest}; continuing from {highest}")
+                self.write_counter(highest)
+                counter = highest
+            return counter
+
+    def write_counter(self, counter):
+        with self.lock, self.conn:
+            self._write_counter(counter)
+
+    def _write_counter(self, counter):
+        # Never moves the counter backwards, in case another process has allocated past this one
+        self.conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('ticket_counter', ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = MAX(CAST(value AS INTEGER), CAST(excluded.value AS INTEGER))",
+            (counter,)
+        )
+
+    def next_ticket_number(self):
+        # Atomic across processes: BEGIN IMMEDIATE takes the database write lock before reading.
+        # Within this process self.lock keeps it out of any transaction the persistence worker has open.
+        with self.lock, self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'ticket_counter'")
+            return int(self.conn.execute("SELECT value FROM meta WHERE key = 'ticket_counter'").fetchone()[0])
+
+    def load_guild_table(self, table):
+        with self.lock:
+            condition, params = shard_filter_sql("CAST(guild_id AS INTEGER)")
+            return {guild_id: json.loads(data) for guild_id, data in self.conn.execute(f"SELECT guild_id, data FROM {table} WHERE {condition}", params)}
+
+    def snapshot_guild_table(self, table, rows):
+        return {guild_id: json.dumps(row) for guild_id, row in rows.items()}
+
+    def write_guild_table(self, table, snapshot):
+        with self.lock, self.conn:
+            self._write_guild_table(table, snapshot)
+
+    def _write_guild_table(self, table, snapshot):
+        # One row per guild, so changing one guild's settings never rewrites another's
+        self.conn.executemany(f"INSERT OR REPLACE INTO {table} (guild_id, data) VALUES (?, ?)", snapshot.items())
+
+def add_column_if_missing(conn, table, column, declaration):
+    # Databases created by older versions lack columns added since; returns True if it was added
+    if any(row[1] == column for row in conn.execute(f"PRAGMA table_info({table})")):
+        return False
+    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+    return True
+
+def open_ticket_store():
+    if TICKET_STORE_BACKEND == "json":
+        if SHARD_IDS is not None:
+            raise RuntimeError("Running a shard range needs TICKET_STORE_BACKEND = \"sqlite\"")
+        return JsonTicketStore(TICKET_DATA_FILE)
+    store = SqliteTicketStore(TICKET_DB_FILE)
+    store.migrate_from_json(TICKET_DATA_FILE)
+    return store
+
+ticket_store = open_ticket_store()
+
+# Load and save ticket data
+def load_ticket_data():
+    return ticket_store.load()
+
+def save_ticket_data(data, ticket_number=None):
+    # Pass the ticket number that changed so only that row is written
+    persistence.mark_ticket(ticket_number)
+    if ticket_number is None:
+        rebuild_ticket_indexes(data)
+    else:
+        update_ticket_index(data, ticket_number)
+
+def export_ticket_data(path=TICKET_DATA_FILE):
+    JsonTicketStore(path).save(load_ticket_data())
 
-# Load and save support panel data
+# Load and save support panel data. Panels are stored per guild, keyed by panel channel id:
+# {guild_id: {channel_id: panel settings, including the panel's message_id}}
 def load_support_panel():
-    try:
-        with open(SUPPORT_PANEL_FILE, "r") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {}
+    panels = ticket_store.load_guild_table("panels")
+    for guild_id, guild_panels in panels.items():
+        if "panel_channel_id" in guild_panels:
+            # Older versions kept a single panel per guild, without its message id
+            panels[guild_id] = {str(guild_panels["panel_channel_id"]): guild_panels}
+    return panels
+
+def find_panel(guild_id, channel_id):
+    return support_panel_data.get(str(guild_id), {}).get(str(channel_id))
 
 def save_support_panel(data):
-    with open(SUPPORT_PANEL_FILE, "w") as f:
-        json.dump(data, f)
+    persistence.mark_guild_table("panels")
+
+# Per-guild ticket settings: {guild_id: {"closed_tickets_category_id", "ticket_log_channel_id"}}.
+# Tickets look these up by guild id, so reconfiguring a guild is a single row update.
+def load_guild_settings():
+    settings = ticket_store.load_guild_table("guild_settings")
+    for guild_id, guild_panels in support_panel_data.items():
+        legacy_panel = next((panel for panel in guild_panels.values() if "ticket_log_channel_id" in panel), None)
+        if guild_id not in settings and legacy_panel:
+            # Older versions kept these settings on the panel (and a copy on every ticket)
+            settings[guild_id] = {
+                "closed_tickets_category_id": legacy_panel.get("closed_tickets_category_id"),
+                "ticket_log_channel_id": legacy_panel.get("ticket_log_channel_id")
+            }
+            save_guild_settings(settings)
+    return settings
+
+def save_guild_settings(data):
+    persistence.mark_guild_table("guild_settings")
+
+def ticket_setting(ticket_info, key):
+    # Tickets from before per-guild settings carry their own copy, used until /support is run again
+    settings = guild_settings.get(str(ticket_info.get("guild_id")))
+    if settings is not None:
+        return settings.get(key)
+    return ticket_info.get(key)
+
+class PersistenceWorker:
+    # Collects dirty marks from handlers and writes them out together, off the event loop, at most
+    # once per PERSIST_INTERVAL. Handlers never wait on the disk.
+    def __init__(self):
+        self.dirty_tickets = set()
+        self.all_tickets_dirty = False
+        self.counter_dirty = False
+        self.dirty_guild_tables = set()
+        self.write_lock = threading.Lock()
+        self.wakeup = None
+        self.task = None
+
+    def start(self):
+        self.wakeup = asyncio.Event()
+        self.task = asyncio.create_task(self.run())
+        if self.all_tickets_dirty or self.dirty_tickets or self.counter_dirty or self.dirty_guild_tables:
+            self.wakeup.set()
+
+    def _wake(self):
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    def mark_ticket(self, ticket_number=None):
+        if ticket_number is None:
+            self.all_tickets_dirty = True
+        else:
+            self.dirty_tickets.add(str(ticket_number))
+        self._wake()
+
+    def mark_counter(self):
+        self.counter_dirty = True
+        self._wake()
+
+    def mark_guild_table(self, table):
+        self.dirty_guild_tables.add(table)
+        self._wake()
+
+    def snapshot(self):
+        snapshot = {}
+        if self.all_tickets_dirty or self.dirty_tickets:
+            snapshot["tickets"] = ticket_store.snapshot(ticket_data, None if self.all_tickets_dirty else self.dirty_tickets)
+        if self.counter_dirty:
+            snapshot["counter"] = ticket_counter
+        guild_tables = {"panels": support_panel_data, "guild_settings": guild_settings}
+        for table in self.dirty_guild_tables:
+            snapshot[table] = ticket_store.snapshot_guild_table(table, guild_tables[table])
+        self.dirty_tickets = set()
+        self.dirty_guild_tables = set()
+        self.all_tickets_dirty = self.counter_dirty = False
+        return snapshot
+
+    def restore(self, snapshot):
+        # Re-mark whatever a failed write was carrying so the next pass retries it
+        if "tickets" in snapshot:
+            replace_all, rows = snapshot["tickets"]
+            if replace_all:
+                self.all_tickets_dirty = True
+            else:
+                self.dirty_tickets.update(rows)
+        self.counter_dirty = self.counter_dirty or "counter" in snapshot
+        self.dirty_guild_tables.update(table for table in GUILD_TABLE_FILES if table in snapshot)
+        self._wake()
+
+    def write(self, snapshot):
+        with self.write_lock, PERSIST_WRITE_SECONDS.time():
+            ticket_store.write_all(snapshot)
+
+    async def run(self):
+        while True:
+            await self.wakeup.wait()
+            await asyncio.sleep(PERSIST_INTERVAL)
+            self.wakeup.clear()
+            snapshot = self.snapshot()
+            try:
+                await asyncio.to_thread(self.write, snapshot)
+            except Exception as e:
+                logger.error(f"Failed to persist ticket data: {str(e)}")
+                self.restore(snapshot)
+
+    def flush(self):
+        # Synchronous final write for shutdown, once the event loop has stopped
+        self.write(self.snapshot())
+
+persistence = PersistenceWorker()
+
+# In-memory indexes over ticket_data, kept in sync by save_ticket_data, so hot paths
+# never scan the whole ticket history
+open_tickets_by_user = {}  # (guild_id, creator_id) -> ticket number
+tickets_by_channel = {}  # channel_id -> ticket number
+_ticket_index_keys = {}  # ticket number -> (open_tickets_by_user key, channel_id)
+
+def update_ticket_index(data, ticket_number):
+    ticket_number = str(ticket_number)
+    user_key, channel_id = _ticket_index_keys.pop(ticket_number, (None, None))
+    if user_key is not None and open_tickets_by_user.get(user_key) == ticket_number:
+        del open_tickets_by_user[user_key]
+    if channel_id is not None and tickets_by_channel.get(channel_id) == ticket_number:
+        del tickets_by_channel[channel_id]
+
+    ticket_info = data.get(ticket_number)
+    if not ticket_info:
+        return
+    user_key = None
+    if ticket_info.get("creator_id") and not ticket_info.get("closer_id"):
+        # Tickets created before guild ids were recorded are indexed under guild None
+        user_key = (ticket_info.get("guild_id"), ticket_info["creator_id"])
+        open_tickets_by_user[user_key] = ticket_number
+    channel_id = ticket_info.get("channel_id")
+    if channel_id is not None:
+        tickets_by_channel[channel_id] = ticket_number
+    _ticket_index_keys[ticket_number] = (user_key, channel_id)
+
+def rebuild_ticket_indexes(data):
+    open_tickets_by_user.clear()
+    tickets_by_channel.clear()
+    _ticket_index_keys.clear()
+    for ticket_number in data:
+        update_ticket_index(data, ticket_number)
+
+def find_open_ticket(guild_id, user_id):
+    return open_tickets_by_user.get((guild_id, user_id)) or open_tickets_by_user.get((None, user_id))
+
+def ticket_for_channel(channel):
+    # (ticket number, ticket info), or (None, {}) when the channel is not a ticket
+    ticket_number = tickets_by_channel.get(channel.id)
+    return ticket_number, ticket_data.get(ticket_number, {}) if ticket_number else {}
+
+TICKET_CHANNEL_NAME = re.compile(r"(?:closed-)?ticket-(\d+)")
+
+backfilled_guilds = set()  # guild ids already scanned by backfill_ticket_channels in this process
+
+def backfill_ticket_channels(guild):
+    # Tickets created before channel ids were recorded are matched to their channel by name, once per
+    # guild: tickets whose channel was deleted never get a channel id, so on_ready firing again after
+    # a reconnect must not rescan. After this every lookup goes through tickets_by_channel.
+    if guild.id in backfilled_guilds:
+        return
+    backfilled_guilds.add(guild.id)
+    for channel in guild.text_channels:
+        match = TICKET_CHANNEL_NAME.fullmatch(channel.name)
+        if not match or channel.id in tickets_by_channel:
+            continue
+        ticket_info = ticket_data.get(match.group(1))
+        if not ticket_info or ticket_info.get("channel_id") or ticket_info.get("guild_id") not in (None, guild.id):
+            continue
+        ticket_info["channel_id"] = channel.id
+        ticket_info["guild_id"] = guild.id
+        # Only the matched ticket is written; a full save would replace every row and rebuild the indexes
+        save_ticket_data(ticket_data, match.group(1))
 
 ticket_counter = load_ticket_counter()
 ticket_data = load_ticket_data()
 support_panel_data = load_support_panel()
+guild_settings = load_guild_settings()
+rebuild_ticket_indexes(ticket_data)
+
+# Role -> member index so staff overwrites scale with staff count rather than guild size.
+# Built per guild on first use from the member cache, then kept current by member/role events.
+role_members = {}  # guild_id -> {role_id: set of member ids}
+admin_cache = {}  # guild_id -> {member_id: bool}
+
+def _role_index(guild):
+    index = role_members.get(guild.id)
+    if index is None:
+        index = role_members[guild.id] = {}
+        for member in guild.members:
+            for role in member.roles:
+                index.setdefault(role.id, set()).add(member.id)
+    return index
+
+def staff_members(guild, role):
+    members = []
+    for member_id in _role_index(guild).get(role.id, ()):
+        member = guild.get_member(member_id)
+        if member:
+            members.append(member)
+    return members
+
+def is_admin(member):
+    guild_cache = admin_cache.setdefault(member.guild.id, {})
+    cached = guild_cache.get(member.id)
+    if cached is None:
+        cached = guild_cache[member.id] = any(role.permissions.administrator for role in member.roles)
+    return cached
+
+class MemberResolver:
+    # Looks members up in the gateway cache first. In a fully chunked guild a miss means the member
+    # left; otherwise it falls back to fetch_member, keeping results (and misses) in an LRU for
+    # MEMBER_CACHE_TTL seconds so a transcript or log entry fetches each person at most once.
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.cache = OrderedDict()  # (guild_id, member_id) -> (expires_at, member or None)
+
+    async def get(self, guild, member_id):
+        if not member_id:
+            return None
+        member = guild.get_member(int(member_id))
+        if member or guild.chunked:
+            return member
+        key = (guild.id, int(member_id))
+        cached = self.cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            self.cache.move_to_end(key)
+            return cached[1]
+        try:
+            member = await guild.fetch_member(int(member_id))
+        except discord.NotFound:
+            member = None
+        except discord.HTTPException as e:
+            logger.warning(f"Could not fetch member {member_id} in guild {guild.id}: {str(e)}")
+            return None
+        self.cache[key] = (time.monotonic() + self.ttl, member)
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.size:
+            self.cache.popitem(last=False)
+        return member
+
+member_resolver = MemberResolver(MEMBER_CACHE_SIZE, MEMBER_CACHE_TTL)
+
+def hide_from_staff(overwrites, guild, staff_role, claimer):
+    # With the full member cache each staff member gets their own overwrite (admins see every channel
+    # regardless). Without it the role's members cannot be listed, so the staff role itself is denied.
+    if guild.chunked:
+        for member in staff_members(guild, staff_role):
+            if member.id != claimer.id and not is_admin(member):
+                overwrites[member] = discord.PermissionOverwrite(view_channel=False)
+    else:
+        overwrites[staff_role] = discord.PermissionOverwrite(view_channel=False)
+    overwrites[claimer] = discord.PermissionOverwrite(view_channel=True, send_messages=True)
+
+def show_to_staff(overwrites, guild, staff_role):
+    if guild.chunked:
+        for member in staff_members(guild, staff_role):
+            overwrites[member] = discord.PermissionOverwrite(view_channel=True, send_messages=True)
+    else:
+        overwrites[staff_role] = discord.PermissionOverwrite(view_channel=True, send_messages=True)
+
+def _update_member_roles(guild_id, member_id, old_role_ids, new_role_ids):
+    index = role_members.get(guild_id)
+    if index is not None:
+        for role_id in old_role_ids - new_role_ids:
+            index.get(role_id, set()).discard(member_id)
+        for role_id in new_role_ids - old_role_ids:
+            index.setdefault(role_id, set()).add(member_id)
+    admin_cache.get(guild_id, {}).pop(member_id, None)
+
+# Log embeds are queued per log channel and sent in batches, so bursts of ticket activity cost one
+# API call per LOG_BATCH_SIZE events and interaction handlers never wait on the log channel
+LOG_BATCH_SIZE = 10  # Discord allows at most 10 embeds per message
+LOG_FLUSH_INTERVAL = 1.0  # Seconds to wait for more events before sending a partial batch
+LOG_SEND_ATTEMPTS = 5  # Attempts per batch before transient errors drop it
+LOG_RETRY_BASE_DELAY = 1.0  # Seconds; doubles on each retry unless Discord says how long to wait
+
+class LogChannelQueue:
+    def __init__(self, log_channel):
+        self.log_channel = log_channel
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self.run())
+
+    def put(self, embed):
+        self.queue.put_nowait((embed, time.monotonic()))
+
+    async def run(self):
+        while True:
+            batch = [await self.queue.get()]
+            deadline = batch[0][1] + LOG_FLUSH_INTERVAL
+            while len(batch) < LOG_BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self.send(batch)
+
+    async def send(self, batch):
+        send_started = time.monotonic()
+        for _, queued_at in batch:
+            LOG_QUEUE_DELAY_SECONDS.observe(send_started - queued_at)
+        if await self.send_embeds([embed for embed, _ in batch]):
+            LOG_SEND_SECONDS.observe(time.monotonic() - send_started)
+
+    async def send_embeds(self, embeds):
+        # One message at a time per channel keeps us inside the channel's rate-limit bucket.
+        # discord.py waits out most 429s itself; 5xx errors and dropped connections are retried here.
+        for attempt in range(LOG_SEND_ATTEMPTS):
+            try:
+                await self.log_channel.send(embeds=embeds)
+                LOG_ENTRIES.inc(len(embeds), outcome="sent")
+                return True
+            except Exception as e:
+                if isinstance(e, discord.HTTPException) and e.status == 400 and len(embeds) > 1:
+                    # Discord rejected the message; send the entries one by one so only the bad one is lost
+                    logger.warning(f"Log channel {self.log_channel.id} rejected a batch, sending entries separately: {str(e)}")
+                    sent = [await self.send_embeds([embed]) for embed in embeds]
+                    return all(sent)
+                if not is_transient_error(e) or attempt + 1 == LOG_SEND_ATTEMPTS:
+                    logger.error(f"Dropped {len(embeds)} log entries for channel {self.log_channel.id}: {str(e)}")
+                    LOG_ENTRIES.inc(len(embeds), outcome="dropped")
+                    return False
+                delay = getattr(e, "retry_after", None) or LOG_RETRY_BASE_DELAY * 2 ** attempt
+                logger.warning(f"Failed to send log to channel {self.log_channel.id}, retrying in {delay:.1f}s: {str(e)}")
+                await asyncio.sleep(delay)
+
+log_queues = {}  # log channel id -> LogChannelQueue
 
 async def log_action(client, title, fields, channel_id, url=None):
     if not channel_id:
@@ -86,13 +1176,19 @@ async def log_action(client, title, fields, channel_id, url=None):
         embed.add_field(name=name, value=str(value) if value else "N/A", inline=False)
     if url:
         embed.add_field(name="Transcript", value=f"[View Transcript]({url})", inline=False)
-    try:
-        await log_channel.send(embed=embed)
-    except Exception as e:
-        logger.error(f"Failed to send log: {str(e)}")
-
-async def generate_transcript(channel, ticket_number):
-    messages = []
+    log_queue = log_queues.get(channel_id)
+    if log_queue is None:
+        log_queue = log_queues[channel_id] = LogChannelQueue(log_channel)
+    log_queue.put(embed)
+
+# User (<@id>, <@!id>) and role (<@&id>) mentions
+MENTION_PATTERN = re.compile(r"<@([!&]?)(\d+)>")
+
+async def generate_transcript(channel, ticket_number, writer):
+    # Streams every message in the channel into the transcript writer as it is formatted.
+    # history() pages through the channel 100 messages at a time, so memory is bounded by
+    # the page size rather than the ticket length. Returns the transcript stats.
+    started = time.perf_counter()
     message_count = 0
     embed_count = 0
     component_count = 0
@@ -106,7 +1202,26 @@ async def generate_transcript(channel, ticket_number):
     initial_message_id = ticket_info.get("initial_message_id")
     confirmation_message_id = ticket_info.get("confirmation_message_id")
 
-    async for message in channel.history(limit=100, oldest_first=True):
+    # Authors are resolved once and written to the transcript's authors table; messages refer to them by id
+    authors = set()
+    # Mentions are rewritten in one pass per message; names are resolved once per transcript
+    mention_names = {}
+
+    def resolve_mention(match):
+        is_role = match.group(1) == "&"
+        mention_id = match.group(2)
+        name = mention_names.get((is_role, mention_id))
+        if name is None:
+            # User mentions are resolved ahead of the substitution, which cannot await
+            if is_role:
+                role = channel.guild.get_role(int(mention_id))
+                name = f"@{role.name}" if role else f"@UnknownRole({mention_id})"
+            else:
+                name = f"@UnknownUser({mention_id})"
+            mention_names[(is_role, mention_id)] = name
+        return name
+
+    async for message in channel.history(limit=None, oldest_first=True):
         message_count += 1
         if not opened_at:
             opened_at = message.created_at
@@ -115,33 +1230,35 @@ async def generate_transcript(channel, ticket_number):
         content = message.content
         has_content = content and content.strip()
         if has_content:
-            user_mention_pattern = r"<@!?(\d+)>"
-            for user_id in re.findall(user_mention_pattern, content):
-                member = channel.guild.get_member(int(user_id))
-                username = member.display_name if member else f"UnknownUser({user_id})"
-                content = content.replace(f"<@!{user_id}>", f"@{username}").replace(f"<@{user_id}>", f"@{username}")
-            role_mention_pattern = r"<@&(\d+)>"
-            for role_id in re.findall(role_mention_pattern, content):
-                role = channel.guild.get_role(int(role_id))
-                role_name = role.name if role else f"UnknownRole({role_id})"
-                content = content.replace(f"<@&{role_id}>", f"@{role_name}")
-        # Get the user's top role color
-        member = channel.guild.get_member(message.author.id)
-        role_color = "#ffffff"  # Default to white if no role color
-        if member:
-            top_role = None
-            for role in sorted(member.roles, key=lambda r: r.position, reverse=True):
-                if role.color.value != 0:
-                    top_role = role
-                    break
-            if top_role:
-                role_color = f"#{top_role.color.value:06x}"
+            for match in MENTION_PATTERN.finditer(content):
+                if match.group(1) != "&" and (False, match.group(2)) not in mention_names:
+                    member = await member_resolver.get(channel.guild, match.group(2))
+                    if member:
+                        mention_names[(False, match.group(2))] = f"@{member.display_name}"
+            content = MENTION_PATTERN.sub(resolve_mention, content)
+        if message.author.id not in authors:
+            # Get the user's top role color
+            member = await member_resolver.get(channel.guild, message.author.id)
+            role_color = "#ffffff"  # Default to white if no role color
+            if member:
+                top_role = None
+                for role in sorted(member.roles, key=lambda r: r.position, reverse=True):
+                    if role.color.value != 0:
+                        top_role = role
+                        break
+                if top_role:
+                    role_color = f"#{top_role.color.value:06x}"
+            authors.add(message.author.id)
+            writer.write_author({
+                "id": message.author.id,
+                "display_name": message.author.display_name,
+                "role_color": role_color,
+                "avatar_url": message.author.avatar.url if message.author.avatar else message.author.default_avatar.url
+            })
         adjusted_time = message.created_at + timedelta(hours=4)
         msg_data = {
-            "display_name": message.author.display_name,
-            "role_color": role_color,
-            "timestamp": adjusted_time.strftime("%B %d, %Y, %I:%M %p"),
-            "avatar_url": message.author.avatar.url if message.author.avatar else message.author.default_avatar.url
+            "author_id": message.author.id,
+            "timestamp": adjusted_time.strftime("%B %d, %Y, %I:%M %p")
         }
         if has_content:
             msg_data["content"] = content
@@ -188,78 +1305,362 @@ async def generate_transcript(channel, ticket_number):
             if buttons:
                 msg_data["buttons"] = buttons
                 logger.debug(f"Fallback: Captured buttons for ticket {ticket_number} at message {message.id}: {buttons}")
-        messages.append(msg_data)
+        writer.write_message(msg_data)
         if "closed" in channel.name and not closed_at:
             closed_at = message.created_at
+    # Display names are snapshotted here, on the event loop, so rendering never has to look up members
+    creator_id = ticket_info.get("creator_id")
+    closer_id = ticket_info.get("closer_id")
+    creator = await member_resolver.get(channel.guild, creator_id)
+    closer = await member_resolver.get(channel.guild, closer_id)
+    elapsed = time.perf_counter() - started
+    TRANSCRIPT_GENERATION_SECONDS.observe(elapsed)
+    TRANSCRIPT_MESSAGES.inc(message_count)
+    TRANSCRIPT_MESSAGES_PER_SECOND.set(message_count / elapsed if elapsed > 0 else 0)
     return {
-        "messages": messages,
-        "stats": {
-            "opened_at": (opened_at + timedelta(hours=4)).strftime("%m/%d/%Y, %H:%M:%S") if opened_at else "N/A",
-            "closed_at": (closed_at + timedelta(hours=4)).strftime("%m/%d/%Y, %H:%M:%S") if closed_at else "N/A",
-            "creator": ticket_data.get(str(ticket_number), {}).get("creator_id"),
-            "closer": ticket_data.get(str(ticket_number), {}).get("closer_id"),
-            "message_count": message_count,
-            "embed_count": embed_count,
-            "component_count": component_count,
-            "server_name": channel.guild.name
-        }
+        "opened_at": (opened_at + timedelta(hours=4)).strftime("%m/%d/%Y, %H:%M:%S") if opened_at else "N/A",
+        "closed_at": (closed_at + timedelta(hours=4)).strftime("%m/%d/%Y, %H:%M:%S") if closed_at else "N/A",
+        "creator": creator_id,
+        "creator_name": creator.display_name if creator else "Unknown",
+        "closer": closer_id,
+        "closer_name": closer.display_name if closer else "Unknown",
+        "message_count": message_count,
+        "embed_count": embed_count,
+        "component_count": component_count,
+        "server_name": channel.guild.name,
+        "content_unavailable": not client.intents.message_content
+    }
+
+class TicketAllocator:
+    # Reserves a ticket number and the creator's open-ticket slot in one step, before any API call,
+    # so concurrent clicks can neither share a number nor both pass the duplicate-ticket check
+    def __init__(self):
+        self.lock = None
+
+    async def reserve(self, guild_id, creator_id, ticket_fields):
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            if find_open_ticket(guild_id, creator_id):
+                return None
+            global ticket_counter
+            if SHARD_IDS is None:
+                ticket_counter += 1
+                # Never reuse a number that already has a ticket, whatever the stored counter said
+                while str(ticket_counter) in ticket_data:
+                    ticket_counter += 1
+                save_ticket_counter(ticket_counter)
+                ticket_number = str(ticket_counter)
+            else:
+                # Processes running other shard ranges number tickets from the same counter
+                ticket_number = str(await asyncio.to_thread(ticket_store.next_ticket_number))
+            ticket_data[ticket_number] = {"creator_id": creator_id, "guild_id": guild_id, **ticket_fields}
+            # Saving indexes the ticket as the creator's open ticket straight away
+            save_ticket_data(ticket_data, ticket_number)
+            return ticket_number
+
+    def release(self, ticket_number):
+        # The ticket channel could not be created; give the creator their slot back
+        ticket_data.pop(ticket_number, None)
+        save_ticket_data(ticket_data, ticket_number)
+
+ticket_allocator = TicketAllocator()
+
+async def gather_isolated(*aws):
+    # Runs independent API calls concurrently; one failing neither cancels nor hides the others
+    results = await asyncio.gather(*aws, return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error(f"Concurrent ticket task failed: {str(result)}")
+    return results
+
+def is_transient_error(error):
+    # Rate limits, Discord outages and dropped connections are worth retrying; anything else is not
+    if isinstance(error, discord.HTTPException):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, (discord.RateLimited, aiohttp.ClientError, asyncio.TimeoutError, OSError))
+
+class JobQueue:
+    # Durable job queue in SQLite. Jobs are written before the interaction is acknowledged, run by a
+    # fixed pool of JOB_WORKERS, retried with exponential backoff on transient errors, and picked up
+    # again after a restart. Finished jobs are deleted; failed ones stay in the table for inspection.
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, payload TEXT NOT NULL, "
+            "status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, run_at REAL NOT NULL, last_error TEXT, guild_id INTEGER)"
+        )
+        add_column_if_missing(self.conn, "jobs", "guild_id", "INTEGER")
+        self.conn.commit()
+        self.db_lock = threading.Lock()
+        self.handlers = {}
+        self.queue = None
+        self.workers = []
+        # Ids of this process's pending and running jobs, kept in memory so the metrics gauge never
+        # queries the database from the event loop
+        self.pending = set()
+
+    def handler(self, kind):
+        def register(func):
+            self.handlers[kind] = func
+            return func
+        return register
+
+    def _execute(self, sql, params=()):
+        with self.db_lock, self.conn:
+            cursor = self.conn.execute(sql, params)
+            return cursor.lastrowid, cursor.fetchall()
+
+    async def _run(self, sql, params=()):
+        return await asyncio.to_thread(self._execute, sql, params)
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        # Jobs that were running when the bot stopped start again from their last saved progress.
+        # Jobs for guilds on other shard ranges belong to the processes running those shards.
+        condition, params = shard_filter_sql("guild_id")
+        self._execute(f"UPDATE jobs SET status = 'pending' WHERE status = 'running' AND {condition}", params)
+        _, pending = self._execute(f"SELECT id, run_at FROM jobs WHERE status = 'pending' AND {condition} ORDER BY id", params)
+        if pending:
+            logger.info(f"Resuming {len(pending)} unfinished jobs")
+        for job_id, run_at in pending:
+            self.pending.add(job_id)
+            self._schedule(job_id, run_at)
+        self.workers = [asyncio.create_task(self.work()) for _ in range(JOB_WORKERS)]
+
+    def _schedule(self, job_id, run_at):
+        delay = max(0, run_at - time.time())
+        asyncio.get_running_loop().call_later(delay, self.queue.put_nowait, job_id)
+
+    async def enqueue(self, kind, payload, guild_id=None):
+        job_id, _ = await self._run(
+            "INSERT INTO jobs (kind, payload, status, run_at, guild_id) VALUES (?, ?, 'pending', ?, ?)",
+            (kind, json.dumps(payload), time.time(), guild_id)
+        )
+        self.pending.add(job_id)
+        self.queue.put_nowait(job_id)
+        return job_id
+
+    async def save_progress(self, job_id, payload):
+        # Handlers record finished steps so a retry or restart does not redo them
+        await self._run("UPDATE jobs SET payload = ? WHERE id = ?", (json.dumps(payload), job_id))
+
+    def will_retry(self, error, attempt):
+        return is_transient_error(error) and attempt + 1 < JOB_MAX_ATTEMPTS
+
+    async def work(self):
+        # Jobs look up channels and members, so nothing runs until the cache is ready
+        await client.wait_until_ready()
+        while True:
+            job_id = await self.queue.get()
+            _, rows = await self._run("SELECT kind, payload, attempts FROM jobs WHERE id = ? AND status = 'pending'", (job_id,))
+            if not rows:
+                self.pending.discard(job_id)
+                continue
+            kind, payload, attempts = rows[0]
+            await self._run("UPDATE jobs SET status = 'running' WHERE id = ?", (job_id,))
+            try:
+                await self.handlers[kind](job_id, json.loads(payload), attempts)
+            except Exception as e:
+                if self.will_retry(e, attempts):
+                    delay = JOB_RETRY_BASE_DELAY * 2 ** attempts
+                    logger.warning(f"Job {job_id} ({kind}) failed, retrying in {delay}s: {str(e)}")
+                    run_at = time.time() + delay
+                    await self._run(
+                        "UPDATE jobs SET status = 'pending', attempts = ?, run_at = ?, last_error = ? WHERE id = ?",
+                        (attempts + 1, run_at, str(e), job_id)
+                    )
+                    self._schedule(job_id, run_at)
+                else:
+                    logger.error(f"Job {job_id} ({kind}) failed after {attempts + 1} attempts: {str(e)}")
+                    await self._run(
+                        "UPDATE jobs SET status = 'failed', attempts = ?, last_error = ? WHERE id = ?",
+                        (attempts + 1, str(e), job_id)
+                    )
+                    self.pending.discard(job_id)
+                continue
+            await self._run("DELETE FROM jobs WHERE id = ?", (job_id,))
+            self.pending.discard(job_id)
+
+job_queue = JobQueue(JOB_DB_FILE)
+
+@job_queue.handler("finalize_ticket")
+@timed(TICKET_OPERATION_SECONDS, operation="close_finalize")
+async def finalize_ticket(job_id, job, attempt):
+    # Everything that happens after a ticket channel is closed: transcript, archive, log, DM and
+    # the closing notice. Runs on the job queue rather than inside the button interaction.
+    ticket_number = job["ticket_number"]
+    ticket_info = ticket_data.get(ticket_number)
+    channel = client.get_channel(job["channel_id"])
+    if not ticket_info or not channel:
+        raise LookupError(f"Ticket {ticket_number} or its channel no longer exists")
+    guild = channel.guild
+
+    # The ticket may have been reopened, or reopened and closed again, while this job waited for a
+    # worker or a retry; then this close has nothing left to finish
+    if ticket_info.get("closer_id") != job["closer_id"] or ticket_info.get("close_id") != job.get("close_id", ticket_info.get("close_id")):
+        logger.info(f"Skipping close job {job_id}: ticket {ticket_number} is no longer closed by this close")
+        return
+
+    if "token" not in job:
+        writer = transcript_archive.writer()
+        try:
+            stats = await generate_transcript(channel, ticket_number, writer)
+            logger.debug(f"Generated transcript for ticket {ticket_number}: {stats}")
+        except Exception as e:
+            writer.abort()
+            if job_queue.will_retry(e, attempt):
+                raise
+            logger.error(f"Failed to generate transcript: {str(e)}")
+            await channel.send("Failed to generate transcript. Ticket closed but transcript unavailable.")
+            writer = transcript_archive.writer()
+            stats = {"opened_at": "N/A", "closed_at": "N/A", "creator": None, "closer": None, "message_count": 0, "embed_count": 0, "component_count": 0, "server_name": guild.name}
+
+        token = secrets.token_hex(16)
+        try:
+            digest = writer.finish(stats)
+            await asyncio.to_thread(transcript_archive.add, ticket_number, digest, token, ticket_info.get("creator_id"))
+            await asyncio.to_thread(transcript_archive.render_html, ticket_number)
+        except Exception as e:
+            logger.error(f"Failed to archive transcript for ticket {ticket_number}: {str(e)}")
+        job["token"] = token
+        await job_queue.save_progress(job_id, job)
+    token = job["token"]
+
+    # TODO: Replace with your own server address and port
+    base_url = "http://YOUR_SERVER_ADDRESS:YOUR_PORT/"
+    transcript_url = f"{base_url}/transcript/{ticket_number}?token={token}"
+
+    creator = await member_resolver.get(guild, ticket_info.get("creator_id"))
+    claimer = await member_resolver.get(guild, ticket_info.get("claimer_id"))
+    closer = await member_resolver.get(guild, ticket_info.get("closer_id"))
+    creator_text = creator.display_name if creator else "N/A"
+    claimer_text = claimer.display_name if claimer else "N/A"
+    closer_text = closer.display_name if closer else "N/A"
+
+    async def notify_creator():
+        if not creator:
+            return
+        embed = discord.Embed(
+            title="Ticket Closed",
+            description=f"Your ticket `ticket-{ticket_number}` has been closed by {job['closer_name']}.\n📜 [View Transcript]({transcript_url})",
+            color=discord.Color.red(),
+            timestamp=discord.utils.utcnow()
+        )
+        try:
+            await creator.send(embed=embed)
+        except discord.Forbidden:
+            logger.warning(f"Could not DM {creator.display_name} (ID: {creator.id}) about ticket closure. DMs may be closed or bot lacks permission.")
+            await channel.send(f"Could not DM {creator.mention} the transcript. Please ensure your DMs are open.")
+        except Exception as e:
+            if job_queue.will_retry(e, attempt):
+                raise
+            logger.error(f"Error sending DM to {creator.display_name}: {str(e)}")
+            await channel.send(f"Error sending transcript to {creator.mention}: {str(e)}")
+
+    steps = {
+        "log": lambda: log_action(client, f"Ticket Closed", {
+            "Created By": creator_text,
+            "Claimed By": claimer_text,
+            "Closed By": closer_text,
+            "Ticket": f"ticket-{ticket_number}",
+            "Channel": channel.mention
+        }, ticket_setting(ticket_info, "ticket_log_channel_id"), url=transcript_url),
+        "dm": notify_creator,
+        "notice": lambda: channel.send(f"Ticket `ticket-{ticket_number}` has been closed by <@{job['closer_id']}>.")
     }
+    # Steps finished on an earlier attempt are skipped so a retry does not log, DM or announce twice
+    done = job.setdefault("done", [])
+    pending = [name for name in steps if name not in done]
+    results = await gather_isolated(*(steps[name]() for name in pending))
+    finished = [name for name, result in zip(pending, results) if not isinstance(result, Exception)]
+    if finished:
+        done.extend(finished)
+        await job_queue.save_progress(job_id, job)
+    for result in results:
+        if isinstance(result, Exception) and job_queue.will_retry(result, attempt):
+            raise result
+
+# Ticket buttons carry no per-ticket state. One instance of each view is registered in setup_hook
+# and dispatches every button by custom_id; the ticket is looked up from the channel at click time.
+async def ticket_for_interaction(interaction):
+    ticket_number, ticket_info = ticket_for_channel(interaction.channel)
+    if not ticket_info:
+        await interaction.response.send_message("Could not find this ticket. The ticket data may be missing.", ephemeral=True)
+    return ticket_number, ticket_info
+
+def render_only(view):
+    # Views sent with a message are only used to draw the buttons. Stopping them keeps discord.py
+    # from storing a view object per message; clicks go to the registered persistent views.
+    view.stop()
+    return view
 
 class SupportButton(discord.ui.Button):
-    def __init__(self, staff_role_id, ticket_category_id, ticket_log_channel_id, label="Create Support Ticket"):
+    def __init__(self, label="Create Support Ticket"):
         super().__init__(style=discord.ButtonStyle.green, label=label, emoji="📬", custom_id="support_button")
-        self.staff_role_id = staff_role_id
-        self.ticket_category_id = ticket_category_id
-        self.ticket_log_channel_id = ticket_log_channel_id
 
+    @profiled("button:support_button", operation="create")
     async def callback(self, interaction: discord.Interaction):
         # Defer the interaction response to avoid timeout
         await interaction.response.defer(ephemeral=True)
 
-        for ticket_id, ticket_info in ticket_data.items():
-            if ticket_info.get("creator_id") == interaction.user.id and not ticket_info.get("closer_id"):
-                await interaction.followup.send("You already have an open ticket! Please wait until it is closed before creating a new one.", ephemeral=True)
-                return
-
-        global ticket_counter
-        ticket_counter += 1
-        save_ticket_counter(ticket_counter)
+        # Panel settings are read at click time so the button keeps working across restarts.
+        # Buttons on panels from before panels were keyed by channel fall back to the guild's panel.
+        panel_data = find_panel(interaction.guild.id, interaction.channel.id)
+        if not panel_data:
+            panel_data = next(iter(support_panel_data.get(str(interaction.guild.id), {}).values()), None)
+        if not panel_data:
+            await interaction.followup.send("This support panel is no longer set up. Please ask an admin to run /support again.", ephemeral=True)
+            return
+        staff_role_id = panel_data.get("staff_role_id")
+        ticket_category_id = panel_data.get("ticket_category_id")
 
         guild = interaction.guild
+        staff_role = guild.get_role(staff_role_id)
+        if staff_role is None:
+            logger.error(f"Staff role {staff_role_id} for the support panel in guild {guild.id} no longer exists")
+            await interaction.followup.send("This support panel's staff role no longer exists. Please ask an admin to run /support again.", ephemeral=True)
+            return
+        ticket_log_channel_id = guild_settings.get(str(guild.id), {}).get("ticket_log_channel_id")
+        ticket_number = await ticket_allocator.reserve(guild.id, interaction.user.id, {
+            "staff_role_id": staff_role_id,
+            "ticket_category_id": ticket_category_id
+        })
+        if ticket_number is None:
+            await interaction.followup.send("You already have an open ticket! Please wait until it is closed before creating a new one.", ephemeral=True)
+            return
+
         server_name = guild.name
-        ticket_category = guild.get_channel(self.ticket_category_id) if self.ticket_category_id else None
-        ticket_channel = await guild.create_text_channel(
-            f"ticket-{ticket_counter}",
-            category=ticket_category,
-            overwrites={
-                guild.default_role: discord.PermissionOverwrite(view_channel=False),
-                interaction.user: discord.PermissionOverwrite(view_channel=True, send_messages=True),
-                guild.get_role(self.staff_role_id): discord.PermissionOverwrite(view_channel=True, send_messages=True),
-                guild.me: discord.PermissionOverwrite(view_channel=True, send_messages=True)
-            }
-        )
+        ticket_category = guild.get_channel(ticket_category_id) if ticket_category_id else None
+        try:
+            ticket_channel = await guild.create_text_channel(
+                f"ticket-{ticket_number}",
+                category=ticket_category,
+                overwrites={
+                    guild.default_role: discord.PermissionOverwrite(view_channel=False),
+                    interaction.user: discord.PermissionOverwrite(view_channel=True, send_messages=True),
+                    staff_role: discord.PermissionOverwrite(view_channel=True, send_messages=True),
+                    guild.me: discord.PermissionOverwrite(view_channel=True, send_messages=True)
+                }
+            )
+        except discord.errors.HTTPException as e:
+            logger.error(f"Failed to create ticket channel: {str(e)}")
+            ticket_allocator.release(ticket_number)
+            await interaction.followup.send("Failed to create your ticket due to an error.", ephemeral=True)
+            return
+        except BaseException:
+            # Any other failure, including cancellation, must not leave the creator holding a ticket
+            # that has no channel
+            ticket_allocator.release(ticket_number)
+            raise
 
-        ticket_data[str(ticket_counter)] = {
-            "creator_id": interaction.user.id,
-            "staff_role_id": self.staff_role_id,
-            "ticket_log_channel_id": self.ticket_log_channel_id,
-            "ticket_category_id": self.ticket_category_id,
-            "closed_tickets_category_id": support_panel_data.get(str(interaction.guild.id), {}).get("closed_tickets_category_id")
-        }
+        ticket_data[ticket_number]["channel_id"] = ticket_channel.id
+        save_ticket_data(ticket_data, ticket_number)
 
-        creator = interaction.guild.get_member(ticket_data[str(ticket_counter)].get("creator_id"))
-        creator_text = creator.display_name if creator else "N/A"
+        creator = interaction.user
+        creator_text = creator.display_name
 
-        await log_action(interaction.client, f"Ticket Created", {
-            "Created By": creator_text,
-            "Claimed By": "N/A",
-            "Closed By": "N/A",
-            "Ticket": f"ticket-{ticket_counter}",
-            "Channel": ticket_channel.mention
-        }, self.ticket_log_channel_id)
-
-        guild_id = str(interaction.guild.id)
-        panel_data = support_panel_data.get(guild_id, {})
         embed = discord.Embed(
             title=panel_data.get("embed_title", f"{server_name} Support Ticket"),
             description=panel_data.get("embed_description", (
@@ -279,42 +1680,53 @@ class SupportButton(discord.ui.Button):
         else:
             logger.debug("No image URL found in panel_data.")
         embed.set_footer(text="🎫 Support")
-        view = TicketView(interaction.user.id, ticket_counter, self.staff_role_id, self.ticket_log_channel_id)
-        initial_buttons = ["📩 Claim Ticket", "🔒 Close Ticket"]
-        message = await ticket_channel.send(embed=embed, view=view)
-        ticket_data[str(ticket_counter)]["initial_message_id"] = str(message.id)
-        ticket_data[str(ticket_counter)]["initial_message_buttons"] = initial_buttons
-        save_ticket_data(ticket_data)
-        logger.debug(f"Stored initial buttons for ticket {ticket_counter}: {initial_buttons}")
-
-        staff_role = guild.get_role(self.staff_role_id)
-        await ticket_channel.send(f"{staff_role.mention} {interaction.user.mention}")
 
-        await interaction.followup.send(f"Your ticket has been created: {ticket_channel.mention}", ephemeral=True)
+        async def send_welcome():
+            # The welcome embed and the staff ping stay in order relative to each other
+            initial_buttons = ["📩 Claim Ticket", "🔒 Close Ticket"]
+            message = await ticket_channel.send(embed=embed, view=render_only(TicketView()))
+            ticket_data[ticket_number]["initial_message_id"] = str(message.id)
+            ticket_data[ticket_number]["initial_message_buttons"] = initial_buttons
+            save_ticket_data(ticket_data, ticket_number)
+            logger.debug(f"Stored initial buttons for ticket {ticket_number}: {initial_buttons}")
+
+            await ticket_channel.send(f"{staff_role.mention} {interaction.user.mention}")
+
+        # The user gets their acknowledgement as soon as the channel exists; the rest runs alongside it
+        await gather_isolated(
+            interaction.followup.send(f"Your ticket has been created: {ticket_channel.mention}", ephemeral=True),
+            send_welcome(),
+            log_action(interaction.client, f"Ticket Created", {
+                "Created By": creator_text,
+                "Claimed By": "N/A",
+                "Closed By": "N/A",
+                "Ticket": f"ticket-{ticket_number}",
+                "Channel": ticket_channel.mention
+            }, ticket_log_channel_id)
+        )
 
 class SupportView(discord.ui.View):
-    def __init__(self, staff_role_id, ticket_category_id, ticket_log_channel_id, button_label="Create Support Ticket"):
+    def __init__(self, button_label="Create Support Ticket"):
         super().__init__(timeout=None)
-        self.add_item(SupportButton(staff_role_id, ticket_category_id, ticket_log_channel_id, button_label))
+        self.add_item(SupportButton(button_label))
 
 class TicketView(discord.ui.View):
-    def __init__(self, ticket_creator_id, ticket_number, staff_role_id, ticket_log_channel_id):
+    def __init__(self):
         super().__init__(timeout=None)
-        self.ticket_creator_id = ticket_creator_id
-        self.ticket_number = ticket_number
-        self.staff_role_id = staff_role_id
-        self.ticket_log_channel_id = ticket_log_channel_id
 
     @discord.ui.button(style=discord.ButtonStyle.green, label="Claim Ticket", emoji="📩", custom_id="claim_ticket")
+    @profiled("button:claim_ticket", operation="claim")
     async def claim_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        staff_role = interaction.guild.get_role(self.staff_role_id)
+        ticket_number, ticket_info = await ticket_for_interaction(interaction)
+        if not ticket_info:
+            return
+        staff_role = interaction.guild.get_role(ticket_info.get("staff_role_id"))
         if staff_role not in interaction.user.roles:
             await interaction.response.send_message("You do not have permission to claim this ticket. This action is restricted to staff members only.", ephemeral=True)
             return
 
-        ticket_info = ticket_data.get(str(self.ticket_number), {})
         if "claimer_id" in ticket_info:
-            claimer = interaction.guild.get_member(ticket_info["claimer_id"])
+            claimer = await member_resolver.get(interaction.guild, ticket_info["claimer_id"])
             if claimer:
                 embed = discord.Embed(
                     description=f"This ticket has already been claimed by {claimer.display_name}.",
@@ -323,71 +1735,69 @@ class TicketView(discord.ui.View):
                 await interaction.response.send_message(embed=embed, ephemeral=True)
                 return
 
-        ticket_data[str(self.ticket_number)]["claimer_id"] = interaction.user.id
-        save_ticket_data(ticket_data)
+        ticket_info["claimer_id"] = interaction.user.id
+        save_ticket_data(ticket_data, ticket_number)
 
         overwrites = interaction.channel.overwrites
-        for member in interaction.guild.members:
-            if staff_role in member.roles and member.id != interaction.user.id:
-                if not any(role.permissions.administrator for role in member.roles):
-                    overwrites[member] = discord.PermissionOverwrite(view_channel=False)
-        overwrites[interaction.user] = discord.PermissionOverwrite(view_channel=True, send_messages=True)
-        overwrites[interaction.guild.get_member(self.ticket_creator_id)] = discord.PermissionOverwrite(view_channel=True, send_messages=True)
+        hide_from_staff(overwrites, interaction.guild, staff_role, interaction.user)
+        creator = await member_resolver.get(interaction.guild, ticket_info.get("creator_id"))
+        if creator:
+            overwrites[creator] = discord.PermissionOverwrite(view_channel=True, send_messages=True)
         await interaction.channel.edit(overwrites=overwrites)
 
         embed = discord.Embed(description=f"This ticket has been claimed by {interaction.user.display_name}.", color=discord.Color.gold())
         await interaction.channel.send(embed=embed)
 
-        creator = interaction.guild.get_member(ticket_data[str(self.ticket_number)].get("creator_id"))
-        claimer = interaction.guild.get_member(ticket_data[str(self.ticket_number)].get("claimer_id"))
         creator_text = creator.display_name if creator else "N/A"
-        claimer_text = claimer.display_name if claimer else "N/A"
+        claimer_text = interaction.user.display_name
 
         await log_action(interaction.client, f"Ticket Claimed", {
             "Created By": creator_text,
             "Claimed By": claimer_text,
             "Closed By": "N/A",
-            "Ticket": f"ticket-{self.ticket_number}",
+            "Ticket": f"ticket-{ticket_number}",
             "Channel": interaction.channel.mention
-        }, self.ticket_log_channel_id)
+        }, ticket_setting(ticket_info, "ticket_log_channel_id"))
         await interaction.response.send_message("You have claimed this ticket!", ephemeral=True)
 
     @discord.ui.button(style=discord.ButtonStyle.red, label="Close Ticket", emoji="🔒", custom_id="close_ticket")
+    @profiled("button:close_ticket")
     async def close_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        staff_role = interaction.guild.get_role(self.staff_role_id)
-        if staff_role not in interaction.user.roles and interaction.user.id != self.ticket_creator_id:
+        ticket_number, ticket_info = await ticket_for_interaction(interaction)
+        if not ticket_info:
+            return
+        staff_role = interaction.guild.get_role(ticket_info.get("staff_role_id"))
+        if staff_role not in interaction.user.roles and interaction.user.id != ticket_info.get("creator_id"):
             await interaction.response.send_message("You do not have permission to close this ticket. This action is restricted to staff members or the ticket creator.", ephemeral=True)
             return
 
         await interaction.response.defer(ephemeral=True)
         embed = discord.Embed(
             title="Ticket Closure",
-            description=f"Confirm closing ticket-{self.ticket_number}?",
+            description=f"Confirm closing ticket-{ticket_number}?",
             color=discord.Color.orange()
         )
-        view = ConfirmCloseView(self.ticket_creator_id, self.ticket_number, interaction.channel, self.staff_role_id, self.ticket_log_channel_id)
-        message = await interaction.channel.send(embed=embed, view=view)
+        message = await interaction.channel.send(embed=embed, view=render_only(ConfirmCloseView()))
         confirmation_buttons = ["Proceed", "Abort"]
-        ticket_data[str(self.ticket_number)]["confirmation_message_id"] = str(message.id)
-        ticket_data[str(self.ticket_number)]["confirmation_message_buttons"] = confirmation_buttons
-        save_ticket_data(ticket_data)
-        logger.debug(f"Stored confirmation buttons for ticket {self.ticket_number}: {confirmation_buttons}")
+        ticket_info["confirmation_message_id"] = str(message.id)
+        ticket_info["confirmation_message_buttons"] = confirmation_buttons
+        save_ticket_data(ticket_data, ticket_number)
+        logger.debug(f"Stored confirmation buttons for ticket {ticket_number}: {confirmation_buttons}")
 
 class ConfirmCloseView(discord.ui.View):
-    def __init__(self, ticket_creator_id, ticket_number, channel, staff_role_id, ticket_log_channel_id):
+    def __init__(self):
         super().__init__(timeout=None)
-        self.ticket_creator_id = ticket_creator_id
-        self.ticket_number = ticket_number
-        self.channel = channel
-        self.staff_role_id = staff_role_id
-        self.ticket_log_channel_id = ticket_log_channel_id
-        self.closed_category_id = ticket_data.get(str(self.ticket_number), {}).get("closed_tickets_category_id")
 
     @discord.ui.button(style=discord.ButtonStyle.green, label="Proceed", custom_id="confirm_yes")
+    @profiled("button:confirm_yes", operation="close")
     async def confirm_yes(self, interaction: discord.Interaction, button: discord.ui.Button):
+        ticket_number, ticket_info = await ticket_for_interaction(interaction)
+        if not ticket_info:
+            return
         await interaction.response.defer(ephemeral=True)
 
-        closed_category = interaction.guild.get_channel(self.closed_category_id) if self.closed_category_id else None
+        closed_category_id = ticket_setting(ticket_info, "closed_tickets_category_id")
+        closed_category = interaction.guild.get_channel(closed_category_id) if closed_category_id else None
 
         overwrites = {
             interaction.guild.default_role: discord.PermissionOverwrite(view_channel=False),
@@ -396,96 +1806,44 @@ class ConfirmCloseView(discord.ui.View):
 
         try:
             if closed_category:
-                await self.channel.edit(
+                await interaction.channel.edit(
                     overwrites=overwrites,
-                    name=f"closed-ticket-{self.ticket_number}",
+                    name=f"closed-ticket-{ticket_number}",
                     category=closed_category
                 )
             else:
-                await self.channel.edit(
+                await interaction.channel.edit(
                     overwrites=overwrites,
-                    name=f"closed-ticket-{self.ticket_number}"
+                    name=f"closed-ticket-{ticket_number}"
                 )
         except discord.errors.HTTPException as e:
             logger.error(f"Failed to close ticket: {str(e)}")
             await interaction.followup.send("Failed to close the ticket due to an error.", ephemeral=True)
             return
 
-        try:
-            transcript = await generate_transcript(self.channel, self.ticket_number)
-            logger.debug(f"Generated transcript for ticket {self.ticket_number}: {transcript}")
-        except Exception as e:
-            logger.error(f"Failed to generate transcript: {str(e)}")
-            await interaction.followup.send("Failed to generate transcript. Ticket closed but transcript unavailable.", ephemeral=True)
-            transcript = {"messages": [], "stats": {"opened_at": "N/A", "closed_at": "N/A", "creator": None, "closer": None, "message_count": 0, "embed_count": 0, "component_count": 0, "server_name": self.channel.guild.name}}
-
-        token = secrets.token_hex(16)
-        transcripts[self.ticket_number] = transcript
-        tokens[self.ticket_number] = {"token": token, "creator_id": self.ticket_creator_id}
-
-        # TODO: Replace with your own server address and port
-        base_url = "http://YOUR_SERVER_ADDRESS:YOUR_PORT/"
-        transcript_url = f"{base_url}/transcript/{self.ticket_number}?token={token}"
-
-        ticket_data[str(self.ticket_number)]["closer_id"] = interaction.user.id
-        save_ticket_data(ticket_data)
-
-        creator = interaction.guild.get_member(ticket_data[str(self.ticket_number)].get("creator_id"))
-        claimer = interaction.guild.get_member(ticket_data[str(self.ticket_number)].get("claimer_id"))
-        closer = interaction.guild.get_member(ticket_data[str(self.ticket_number)].get("closer_id"))
-        creator_text = creator.display_name if creator else "N/A"
-        claimer_text = claimer.display_name if claimer else "N/A"
-        closer_text = closer.display_name if closer else "N/A"
-
-        await log_action(interaction.client, f"Ticket Closed", {
-            "Created By": creator_text,
-            "Claimed By": claimer_text,
-            "Closed By": closer_text,
-            "Ticket": f"ticket-{self.ticket_number}",
-            "Channel": self.channel.mention
-        }, self.ticket_log_channel_id, url=transcript_url)
-
-        creator_member = interaction.guild.get_member(self.ticket_creator_id)
-        if creator_member:
-            embed = discord.Embed(
-                title="Ticket Closed",
-                description=f"Your ticket `ticket-{self.ticket_number}` has been closed by {interaction.user.display_name}.\n📜 [View Transcript]({transcript_url})",
-                color=discord.Color.red(),
-                timestamp=discord.utils.utcnow()
-            )
-            try:
-                await creator_member.send(embed=embed)
-            except discord.Forbidden:
-                logger.warning(f"Could not DM {creator_member.display_name} (ID: {creator_member.id}) about ticket closure. DMs may be closed or bot lacks permission.")
-                await self.channel.send(f"Could not DM {creator_member.mention} the transcript. Please ensure your DMs are open.")
-            except Exception as e:
-                logger.error(f"Error sending DM to {creator_member.display_name}: {str(e)}")
-                await self.channel.send(f"Error sending transcript to {creator_member.mention}: {str(e)}")
-
-        await self.channel.send(f"Ticket `ticket-{self.ticket_number}` has been closed by {interaction.user.mention}.")
-
+        # Record the closer before the transcript is built so its stats include them. The close id
+        # tells the job apart from a later close of the same ticket after a reopen.
+        close_id = secrets.token_hex(8)
+        ticket_info["closer_id"] = interaction.user.id
+        ticket_info["close_id"] = close_id
+        save_ticket_data(ticket_data, ticket_number)
+
+        # Transcript, log and DM run on the job queue; the job is stored before the user is told
+        await job_queue.enqueue("finalize_ticket", {
+            "ticket_number": str(ticket_number),
+            "channel_id": interaction.channel.id,
+            "closer_id": interaction.user.id,
+            "close_id": close_id,
+            "closer_name": interaction.user.display_name
+        }, guild_id=interaction.guild.id)
         await interaction.followup.send("Ticket closed!", ephemeral=True)
 
     @discord.ui.button(style=discord.ButtonStyle.red, label="Abort", custom_id="confirm_no")
+    @profiled("button:confirm_no")
     async def confirm_no(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.send_message("Ticket closure canceled.", ephemeral=True)
 
-@app.route('/transcript/<ticket_number>')
-def show_transcript(ticket_number):
-    token = request.args.get('token')
-    logger.debug(f"Accessing transcript for ticket {ticket_number} with token {token}")
-    if not token or int(ticket_number) not in tokens or tokens[int(ticket_number)]["token"] != token:
-        logger.error(f"Invalid or missing token for ticket {ticket_number}")
-        abort(403)
-
-    creator_id = tokens[int(ticket_number)]["creator_id"]
-    transcript = transcripts.get(int(ticket_number))
-    if not transcript:
-        logger.error(f"Transcript not found for ticket {ticket_number}")
-        abort(404)
-
-    logger.debug(f"Rendering transcript for ticket {ticket_number}: {transcript}")
-    html = """
+TRANSCRIPT_TEMPLATE = """
     <!DOCTYPE html>
     <html lang="en">
     <head>
@@ -593,64 +1951,207 @@ def show_transcript(ticket_number):
     <body>
         <div class="container">
             <div class="messages">
-                {% if transcript.messages %}
-                    {% for message in transcript.messages %}
-                    <div class="message">
-                        <img src="{{ message.avatar_url }}" alt="Avatar" class="avatar">
-                        <div class="message-content">
-                            <span class="display-name" style="color: {{ message.role_color }}">{{ message.display_name }}</span>
-                            <span class="timestamp">[{{ message.timestamp }}]</span>
-                            {% if message.content %}
-                                <div class="content">{{ message.content }}</div>
-                            {% endif %}
-                            {% if message.embeds %}
-                                {% for embed_text, embed_color in message.embeds %}
-                                    <div class="embed">
-                                        <hr>
-                                        {{ embed_text | safe }}
-                                        <hr>
-                                    </div>
-                                {% endfor %}
-                            {% endif %}
-                            {% if message.buttons %}
-                                <div class="buttons">
-                                    {% for button in message.buttons %}
-                                        <span class="button
-                                            {% if 'Claim Ticket' in button %}claim-ticket{% endif %}
-                                            {% if 'Close Ticket' in button %}close-ticket{% endif %}
-                                            {% if button == 'Proceed' %}close{% endif %}
-                                            {% if button == 'Abort' %}cancel{% endif %}
-                                        ">{{ button | safe }}</span>
-                                    {% endfor %}
+                {% for message in transcript.messages %}
+                {# Older transcripts carry author details on each message instead of an authors table #}
+                {% set author = transcript.authors.get(message.author_id, message) %}
+                <div class="message">
+                    <img src="{{ author.avatar_url }}" alt="Avatar" class="avatar">
+                    <div class="message-content">
+                        <span class="display-name" style="color: {{ author.role_color }}">{{ author.display_name }}</span>
+                        <span class="timestamp">[{{ message.timestamp }}]</span>
+                        {% if message.content %}
+                            <div class="content">{{ message.content }}</div>
+                        {% endif %}
+                        {% if message.embeds %}
+                            {% for embed_text, embed_color in message.embeds %}
+                                <div class="embed">
+                                    <hr>
+                                    {{ embed_text | safe }}
+                                    <hr>
                                 </div>
-                            {% endif %}
-                        </div>
+                            {% endfor %}
+                        {% endif %}
+                        {% if message.buttons %}
+                            <div class="buttons">
+                                {% for button in message.buttons %}
+                                    <span class="button
+                                        {% if 'Claim Ticket' in button %}claim-ticket{% endif %}
+                                        {% if 'Close Ticket' in button %}close-ticket{% endif %}
+                                        {% if button == 'Proceed' %}close{% endif %}
+                                        {% if button == 'Abort' %}cancel{% endif %}
+                                    ">{{ button | safe }}</span>
+                                {% endfor %}
+                            </div>
+                        {% endif %}
                     </div>
-                    {% endfor %}
+                </div>
                 {% else %}
                     <p>No messages found in this transcript.</p>
-                {% endif %}
+                {% endfor %}
             </div>
             <div class="stats">
                 <strong>Stats:</strong><br>
                 <span class="key">Ticket Opened:</span> <span class="value">{{ transcript.stats.opened_at }}</span><br>
                 <span class="key">Ticket Closed:</span> <span class="value">{{ transcript.stats.closed_at }}</span><br>
-                <span class="key">Creator:</span> <span class="value">{% if transcript.stats.creator %}{{ transcript.stats.creator|member_display_name }}{% else %}N/A{% endif %}</span><br>
-                <span class="key">Closed by:</span> <span class="value">{% if transcript.stats.closer %}{{ transcript.stats.closer|member_display_name }}{% else %}N/A{% endif %}</span><br>
+                <span class="key">Creator:</span> <span class="value">{% if transcript.stats.creator %}{{ transcript.stats.creator_name or "Unknown" }}{% else %}N/A{% endif %}</span><br>
+                <span class="key">Closed by:</span> <span class="value">{% if transcript.stats.closer %}{{ transcript.stats.closer_name or "Unknown" }}{% else %}N/A{% endif %}</span><br>
                 <span class="key">Messages:</span> <span class="value">{{ transcript.stats.message_count }}</span><br>
                 <span class="key">Embeds:</span> <span class="value">{{ transcript.stats.embed_count }}</span><br>
                 <span class="key">Components:</span> <span class="value">{{ transcript.stats.component_count }}</span><br>
                 <span class="key">Server:</span> <span class="value">{{ transcript.stats.server_name }}</span>
+                {% if transcript.stats.content_unavailable %}
+                <br><span class="key">Note:</span> <span class="value">Message content was not available to the bot when this transcript was saved.</span>
+                {% endif %}
             </div>
         </div>
     </body>
     </html>
     """
-    def member_display_name(member_id):
-        member = discord.utils.get(client.get_all_members(), id=member_id)
-        return member.display_name if member else "Unknown"
-    app.jinja_env.filters['member_display_name'] = member_display_name
-    return render_template_string(html, ticket_number=ticket_number, transcript=transcript)
+
+# The transcript template gets its own environment, set up once at startup, with compiled
+# bytecode cached on disk so restarts skip the compile too. Rendering only reads the archived
+# transcript (member names are snapshotted at close), never Flask or discord.py state, so it is
+# safe from any thread.
+TEMPLATE_CACHE_DIR = os.path.join(TRANSCRIPT_DIR, ".template_cache")
+os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+transcript_env = Environment(
+    loader=DictLoader({"transcript.html": TRANSCRIPT_TEMPLATE}),
+    autoescape=True,
+    bytecode_cache=FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)
+)
+transcript_template = transcript_env.get_template("transcript.html")
+
+def render_transcript_chunks(ticket_number, transcript):
+    # Yields the rendered page piece by piece so large transcripts never sit in memory whole
+    yield from transcript_template.generate(ticket_number=ticket_number, transcript=transcript)
+
+def render_transcript(ticket_number, transcript):
+    return "".join(render_transcript_chunks(ticket_number, transcript))
+
+def export_transcript_html(ticket_number, path):
+    transcript = transcript_archive.open(ticket_number)
+    if not transcript:
+        raise FileNotFoundError(f"No transcript archived for ticket {ticket_number}")
+    with open(path, "w", encoding="utf-8") as f:
+        for chunk in render_transcript_chunks(ticket_number, transcript):
+            f.write(chunk)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    if request.endpoint == "show_transcript":
+        TRANSCRIPT_HTTP_REQUESTS.inc(status=response.status_code)
+        TRANSCRIPT_HTTP_SECONDS.observe(time.perf_counter() - g.request_started)
+    return response
+
+@app.route('/metrics')
+def show_metrics():
+    if not METRICS_ENABLED:
+        abort(404)
+    return render_metrics(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+@app.route('/transcript/<ticket_number>')
+def show_transcript(ticket_number):
+    token = request.args.get('token')
+    logger.debug(f"Accessing transcript for ticket {ticket_number} with token {token}")
+    entry = transcript_archive.authorized_entry(ticket_number, token)
+    if not entry:
+        logger.error(f"Invalid or missing token for ticket {ticket_number}")
+        abort(403)
+
+    html_digest = entry.get("html")
+    if not html_digest:
+        # Transcripts archived before pages were pre-rendered are rendered once, on first view
+        try:
+            html_digest = transcript_archive.render_html(ticket_number)
+        except FileNotFoundError:
+            logger.error(f"Transcript not found for ticket {ticket_number}")
+            abort(404)
+
+    gzipped = "gzip" in request.headers.get("Accept-Encoding", "")
+    response = send_file(
+        os.path.abspath(transcript_archive.html_path_for(html_digest, gzipped)),
+        mimetype="text/html",
+        download_name=f"transcript-{ticket_number}.html",
+        etag=f"{html_digest}-gz" if gzipped else html_digest,
+        max_age=TRANSCRIPT_MAX_AGE,
+        conditional=True
+    )
+    # Pages never change once rendered, but they sit behind a per-ticket token
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    response.vary.add("Accept-Encoding")
+    if gzipped:
+        response.headers["Content-Encoding"] = "gzip"
+    return response
+
+async def aiohttp_show_transcript(request):
+    # Same contract as the Flask route: /transcript/<ticket_number>?token=...
+    ticket_number = request.match_info["ticket_number"]
+    token = request.query.get("token")
+    # Cache hits are answered on the loop; only a miss reads the database, off the loop
+    entry = transcript_archive.authorized_entry(ticket_number, token, cached_only=True)
+    if not entry:
+        entry = await asyncio.to_thread(transcript_archive.authorized_entry, ticket_number, token)
+    if not entry:
+        logger.error(f"Invalid or missing token for ticket {ticket_number}")
+        raise web.HTTPForbidden()
+
+    html_digest = entry.get("html")
+    if not html_digest:
+        try:
+            html_digest = await asyncio.to_thread(transcript_archive.render_html, ticket_number)
+        except FileNotFoundError:
+            logger.error(f"Transcript not found for ticket {ticket_number}")
+            raise web.HTTPNotFound()
+
+    # FileResponse uses sendfile, answers conditional requests from its ETag, and serves the
+    # pre-gzipped sibling file when the client accepts gzip
+    return web.FileResponse(
+        transcript_archive.html_path_for(html_digest),
+        headers={
+            "Cache-Control": f"private, max-age={TRANSCRIPT_MAX_AGE}, immutable",
+            "Vary": "Accept-Encoding"
+        }
+    )
+
+async def aiohttp_show_metrics(request):
+    if not METRICS_ENABLED:
+        raise web.HTTPNotFound()
+    return web.Response(text=render_metrics(), content_type="text/plain", charset="utf-8")
+
+def make_transcript_web_app():
+    request_slots = asyncio.Semaphore(TRANSCRIPT_SERVER_MAX_CONCURRENT_REQUESTS)
+
+    @web.middleware
+    async def limit_concurrency(request, handler):
+        # Requests beyond the limit wait for a slot instead of piling work onto the loop
+        async with request_slots:
+            return await handler(request)
+
+    @web.middleware
+    async def start_request_timer(request, handler):
+        request["started"] = time.perf_counter()
+        return await handler(request)
+
+    async def record_request_metrics(request, response):
+        # Recorded as the response is prepared: FileResponse only turns a conditional request into a
+        # 304 at that point, and errors raised by handlers have been converted to responses by then
+        started = request.get("started")
+        if started is None or request.path == "/metrics":
+            return
+        TRANSCRIPT_HTTP_REQUESTS.inc(status=response.status)
+        TRANSCRIPT_HTTP_SECONDS.observe(time.perf_counter() - started)
+
+    web_app = web.Application(middlewares=[start_request_timer, limit_concurrency])
+    web_app.on_response_prepare.append(record_request_metrics)
+    web_app.router.add_get("/transcript/{ticket_number}", aiohttp_show_transcript)
+    web_app.router.add_get("/metrics", aiohttp_show_metrics)
+    return web_app
 
 @client.tree.command(name="support", description="Open the support panel to create a ticket")
 @app_commands.describe(
@@ -662,6 +2163,7 @@ def show_transcript(ticket_number):
     color="The color for the embed (hex code, e.g., 0xFF0000 for red, optional)",
     image="Optional URL to an image or GIF for the support panel (e.g., https://example.com/image.png)"
 )
+@profiled("command:support")
 async def support(interaction: discord.Interaction, panel: discord.TextChannel, staff: discord.Role, tickets_category: discord.CategoryChannel = None, closed_tickets: discord.CategoryChannel = None, logs: discord.TextChannel = None, color: int = None, image: str = None):
     # TODO: Replace YOUR_ADMIN_USER_ID with the Discord user ID of the admin who can run this command
     if interaction.user.id != YOUR_ADMIN_USER_ID:
@@ -678,15 +2180,14 @@ async def support(interaction: discord.Interaction, panel: discord.TextChannel,
         embed.set_image(url=image)
     embed.set_footer(text="🎫 Support")
     ticket_category_id = tickets_category.id if tickets_category else None
-    ticket_log_channel_id = logs.id if logs else None
-    closed_category_id = closed_tickets.id if closed_tickets else None
 
-    support_panel_data[str(interaction.guild.id)] = {
+    panel_message = await panel.send(embed=embed, view=render_only(SupportView()))
+    # Several panels can live in one guild, one per channel; /support in a channel replaces its panel
+    support_panel_data.setdefault(str(interaction.guild.id), {})[str(panel.id)] = {
         "panel_channel_id": panel.id,
+        "message_id": panel_message.id,
         "staff_role_id": staff.id,
         "ticket_category_id": ticket_category_id,
-        "closed_tickets_category_id": closed_category_id,
-        "ticket_log_channel_id": ticket_log_channel_id,
         "embed_title": f"{server_name} Support System",
         "embed_description": "Welcome to our assistance center!\nTap the button below to initiate a ticket, where our expert team will promptly address your concerns.\n**Guidance:** Please remain polite, provide detailed information, and refrain from excessive pings—our support will reach out soon!",
         "embed_color": color if color is not None else 0x00FFFF,
@@ -695,13 +2196,13 @@ async def support(interaction: discord.Interaction, panel: discord.TextChannel,
     }
     save_support_panel(support_panel_data)
 
-    for ticket in ticket_data.values():
-        ticket["closed_tickets_category_id"] = closed_category_id
-        ticket["ticket_log_channel_id"] = ticket_log_channel_id
-    save_ticket_data(ticket_data)
+    # Closed-ticket category and log channel apply to every ticket in the guild, old and new
+    guild_settings[str(interaction.guild.id)] = {
+        "closed_tickets_category_id": closed_tickets.id if closed_tickets else None,
+        "ticket_log_channel_id": logs.id if logs else None
+    }
+    save_guild_settings(guild_settings)
 
-    view = SupportView(staff.id, ticket_category_id, ticket_log_channel_id)
-    await panel.send(embed=embed, view=view)
     combined_guide = (
         "**Embed Customization Guide:**\n"
         "**Image URL Rules:**\n"
@@ -723,6 +2224,7 @@ async def support(interaction: discord.Interaction, panel: discord.TextChannel,
     button_label="The new label for the Create Support Ticket button (optional)",
     image="Optional new URL to an image or GIF for the support panel (e.g., https://example.com/image.png, optional; leave blank to remove)"
 )
+@profiled("command:edit")
 async def edit_support(interaction: discord.Interaction, panel_channel: discord.TextChannel, title: str = None, description: str = None, color: int = None, button_label: str = None, image: str = None):
     # TODO: Replace YOUR_ADMIN_USER_ID with the Discord user ID of the admin who can run this command
     if interaction.user.id != YOUR_ADMIN_USER_ID:
@@ -738,72 +2240,77 @@ async def edit_support(interaction: discord.Interaction, panel_channel: discord.
         await interaction.response.send_message(embed=embed, ephemeral=True)
         return
 
-    guild_id = str(interaction.guild.id)
-    panel_data = support_panel_data.get(guild_id)
-    if not panel_data or panel_data.get("panel_channel_id") != panel_channel.id:
+    panel_data = find_panel(interaction.guild.id, panel_channel.id)
+    if not panel_data:
         await interaction.response.send_message("No support panel found in the specified channel. Please set up a panel using /support first.", ephemeral=True)
         return
 
-    async for message in panel_channel.history(limit=100):
-        if message.author == client.user and message.embeds and message.embeds[0].footer.text == "🎫 Support":
-            new_title = title if title else panel_data["embed_title"]
-            new_description = description if description else panel_data["embed_description"]
-            new_color = color if color is not None else panel_data["embed_color"]
-            new_button_label = button_label if button_label else panel_data["button_label"]
-            new_image = image if image else panel_data.get("image")
-
-            if image and not (image.startswith("http://") or image.startswith("https://")) or (image and not any(image.lower().endswith(ext) for ext in ['.png', '.jpg', '.jpeg', '.gif'])):
-                new_image = panel_data.get("image")
-            elif image == "":
-                new_image = None
-
-            new_embed = discord.Embed(
-                title=new_title,
-                description=new_description,
-                color=new_color
-            )
-            if new_image and (new_image.startswith("http://") or new_image.startswith("https://")) and any(new_image.lower().endswith(ext) for ext in ['.png', '.jpg', '.jpeg', '.gif']):
-                new_embed.set_image(url=new_image)
-            new_embed.set_footer(text="🎫 Support")
-
-            new_view = SupportView(
-                panel_data["staff_role_id"],
-                panel_data["ticket_category_id"],
-                panel_data["ticket_log_channel_id"],
-                new_button_label
-            )
+    message_id = panel_data.get("message_id")
+    if message_id:
+        message = panel_channel.get_partial_message(message_id)
+    else:
+        # Panels posted before message ids were stored: find the message once and remember it
+        message = None
+        async for candidate in panel_channel.history(limit=100):
+            if candidate.author == client.user and candidate.embeds and candidate.embeds[0].footer.text == "🎫 Support":
+                message = candidate
+                break
+    if message is None:
+        await interaction.response.send_message("Could not find the support panel message in the specified channel. Please ensure the panel exists and hasn't been deleted.", ephemeral=True)
+        return
 
-            await message.edit(embed=new_embed, view=new_view)
-
-            panel_data["embed_title"] = new_title
-            panel_data["embed_description"] = new_description
-            panel_data["embed_color"] = new_color
-            panel_data["button_label"] = new_button_label
-            panel_data["image"] = new_image
-            support_panel_data[guild_id] = panel_data
-            save_support_panel(support_panel_data)
-
-            combined_guide = (
-                "**Embed Customization Guide:**\n"
-                "**Image URL Rules:**\n"
-                "- Use a valid URL starting with `http://` or `https://`.\n"
-                "- The URL must end with `.png`, `.jpg`, `.jpeg`, or `.gif`.\n"
-                "- Avoid adding parameters like `?` or `#` at the end of the URL (e.g., use `https://example.com/image.png` instead of `https://example.com/image.png?param=value`).\n"
-                "**Note on Embed Color:** If you'd like to change the color in the future using the `/edit` command, use a hex color code in the format `0xRRGGBB` (e.g., `0xFF0000` for red).\n"
-                "You can pick a color and get its hex code from a site like https://www.color-hex.com/.\n"
-                "Just replace the '#' with '0x' when entering the code (e.g., #FF0000 becomes 0xFF0000)."
-            )
-            await interaction.response.send_message(f"Support panel updated successfully!\n\n{combined_guide}", ephemeral=True)
-            return
+    new_title = title if title else panel_data["embed_title"]
+    new_description = description if description else panel_data["embed_description"]
+    new_color = color if color is not None else panel_data["embed_color"]
+    new_button_label = button_label if button_label else panel_data["button_label"]
+    new_image = image if image else panel_data.get("image")
+
+    if image and not (image.startswith("http://") or image.startswith("https://")) or (image and not any(image.lower().endswith(ext) for ext in ['.png', '.jpg', '.jpeg', '.gif'])):
+        new_image = panel_data.get("image")
+    elif image == "":
+        new_image = None
+
+    new_embed = discord.Embed(
+        title=new_title,
+        description=new_description,
+        color=new_color
+    )
+    if new_image and (new_image.startswith("http://") or new_image.startswith("https://")) and any(new_image.lower().endswith(ext) for ext in ['.png', '.jpg', '.jpeg', '.gif']):
+        new_embed.set_image(url=new_image)
+    new_embed.set_footer(text="🎫 Support")
 
-    await interaction.response.send_message("Could not find the support panel message in the specified channel. Please ensure the panel exists and hasn't been deleted.", ephemeral=True)
+    try:
+        await message.edit(embed=new_embed, view=render_only(SupportView(new_button_label)))
+    except discord.NotFound:
+        await interaction.response.send_message("Could not find the support panel message in the specified channel. Please ensure the panel exists and hasn't been deleted.", ephemeral=True)
+        return
+
+    panel_data["message_id"] = message.id
+    panel_data["embed_title"] = new_title
+    panel_data["embed_description"] = new_description
+    panel_data["embed_color"] = new_color
+    panel_data["button_label"] = new_button_label
+    panel_data["image"] = new_image
+    save_support_panel(support_panel_data)
+
+    combined_guide = (
+        "**Embed Customization Guide:**\n"
+        "**Image URL Rules:**\n"
+        "- Use a valid URL starting with `http://` or `https://`.\n"
+        "- The URL must end with `.png`, `.jpg`, `.jpeg`, or `.gif`.\n"
+        "- Avoid adding parameters like `?` or `#` at the end of the URL (e.g., use `https://example.com/image.png` instead of `https://example.com/image.png?param=value`).\n"
+        "**Note on Embed Color:** If you'd like to change the color in the future using the `/edit` command, use a hex color code in the format `0xRRGGBB` (e.g., `0xFF0000` for red).\n"
+        "You can pick a color and get its hex code from a site like https://www.color-hex.com/.\n"
+        "Just replace the '#' with '0x' when entering the code (e.g., #FF0000 becomes 0xFF0000)."
+    )
+    await interaction.response.send_message(f"Support panel updated successfully!\n\n{combined_guide}", ephemeral=True)
 
 @client.tree.command(name="delete", description="Delete a ticket (staff only)")
 @app_commands.describe(ticket="The ticket channel to delete")
+@profiled("command:delete")
 async def delete_ticket(interaction: discord.Interaction, ticket: discord.TextChannel):
-    ticket_number = ticket.name.split("-")[-1]
-    ticket_info = ticket_data.get(str(ticket_number), {})
-    if not ticket.name.startswith(("ticket-", "closed-ticket-")):
+    ticket_number, ticket_info = ticket_for_channel(ticket)
+    if not ticket_info:
         await interaction.response.send_message("This channel is not a ticket channel.", ephemeral=True)
         return
     staff_role = interaction.guild.get_role(ticket_info.get("staff_role_id"))
@@ -816,11 +2323,11 @@ async def delete_ticket(interaction: discord.Interaction, ticket: discord.TextCh
     await log_action(interaction.client, f"Ticket Deleted", {
         "Deleted By": interaction.user.display_name,
         "Ticket": ticket_name
-    }, ticket_info.get("ticket_log_channel_id"))
+    }, ticket_setting(ticket_info, "ticket_log_channel_id"))
 
     if str(ticket_number) in ticket_data:
         del ticket_data[str(ticket_number)]
-        save_ticket_data(ticket_data)
+        save_ticket_data(ticket_data, ticket_number)
 
     await ticket.delete()
 
@@ -828,14 +2335,14 @@ async def delete_ticket(interaction: discord.Interaction, ticket: discord.TextCh
 
 @client.tree.command(name="reopen", description="Reopen a closed ticket (staff only)")
 @app_commands.describe(ticket="The closed ticket channel to reopen")
+@profiled("command:reopen")
 async def reopen_ticket(interaction: discord.Interaction, ticket: discord.TextChannel):
-    ticket_number = ticket.name.split("-")[-1]
-    ticket_info = ticket_data.get(str(ticket_number), {})
+    ticket_number, ticket_info = ticket_for_channel(ticket)
     staff_role = interaction.guild.get_role(ticket_info.get("staff_role_id"))
     if not staff_role or staff_role not in interaction.user.roles:
         await interaction.response.send_message("You do not have permission to use this command. This action is restricted to staff members only.", ephemeral=True)
         return
-    if not ticket.name.startswith("closed-ticket-"):
+    if not ticket_info.get("closer_id"):
         await interaction.response.send_message("This channel is not a closed ticket.", ephemeral=True)
         return
 
@@ -844,7 +2351,7 @@ async def reopen_ticket(interaction: discord.Interaction, ticket: discord.TextCh
         await interaction.response.send_message("Could not determine the ticket creator. The ticket data may be missing.", ephemeral=True)
         return
 
-    creator = interaction.guild.get_member(ticket_creator_id)
+    creator = await member_resolver.get(interaction.guild, ticket_creator_id)
     if not creator:
         await interaction.response.send_message("The ticket creator is no longer in the server.", ephemeral=True)
         return
@@ -872,13 +2379,18 @@ async def reopen_ticket(interaction: discord.Interaction, ticket: discord.TextCh
         await interaction.response.send_message("Failed to reopen the ticket due to an error.", ephemeral=True)
         return
 
-    creator = interaction.guild.get_member(ticket_data[str(ticket_number)].get("creator_id"))
-    claimer = interaction.guild.get_member(ticket_data[str(ticket_number)].get("claimer_id"))
-    closer = interaction.guild.get_member(ticket_data[str(ticket_number)].get("closer_id"))
+    creator = await member_resolver.get(interaction.guild, ticket_data[str(ticket_number)].get("creator_id"))
+    claimer = await member_resolver.get(interaction.guild, ticket_data[str(ticket_number)].get("claimer_id"))
+    closer = await member_resolver.get(interaction.guild, ticket_data[str(ticket_number)].get("closer_id"))
     creator_text = creator.display_name if creator else "N/A"
     claimer_text = claimer.display_name if claimer else "N/A"
     closer_text = closer.display_name if closer else "N/A"
 
+    # A reopened ticket counts as the creator's open ticket again
+    ticket_data[str(ticket_number)].pop("closer_id", None)
+    ticket_data[str(ticket_number)].pop("close_id", None)
+    save_ticket_data(ticket_data, ticket_number)
+
     await log_action(interaction.client, f"Ticket Reopened", {
         "Created By": creator_text,
         "Claimed By": claimer_text,
@@ -886,19 +2398,19 @@ async def reopen_ticket(interaction: discord.Interaction, ticket: discord.TextCh
         "Reopened By": f"{interaction.user.display_name}",
         "Ticket": f"ticket-{ticket_number}",
         "Channel": ticket.mention
-    }, ticket_info.get("ticket_log_channel_id"))
+    }, ticket_setting(ticket_info, "ticket_log_channel_id"))
     await interaction.response.send_message(f"Ticket {ticket.name} has been reopened.", ephemeral=True)
 
 @client.tree.command(name="unclaim", description="Unclaim a ticket (only the claimer can use this)")
+@profiled("command:unclaim")
 async def unclaim_ticket(interaction: discord.Interaction):
     await interaction.response.defer(ephemeral=True)
 
-    if not interaction.channel.name.startswith("ticket-"):
+    ticket_number, ticket_info = ticket_for_channel(interaction.channel)
+    if not ticket_info or ticket_info.get("closer_id"):
         await interaction.followup.send("This command can only be used in a ticket channel.", ephemeral=True)
         return
 
-    ticket_number = interaction.channel.name.split("-")[-1]
-    ticket_info = ticket_data.get(str(ticket_number), {})
     claimer_id = ticket_info.get("claimer_id")
 
     if not claimer_id:
@@ -911,16 +2423,14 @@ async def unclaim_ticket(interaction: discord.Interaction):
 
     staff_role = interaction.guild.get_role(ticket_info.get("staff_role_id"))
     overwrites = interaction.channel.overwrites
-    for member in interaction.guild.members:
-        if staff_role in member.roles:
-            overwrites[member] = discord.PermissionOverwrite(view_channel=True, send_messages=True)
+    show_to_staff(overwrites, interaction.guild, staff_role)
     await interaction.channel.edit(overwrites=overwrites)
 
     ticket_data[str(ticket_number)].pop("claimer_id", None)
-    save_ticket_data(ticket_data)
+    save_ticket_data(ticket_data, ticket_number)
 
-    creator = interaction.guild.get_member(ticket_data[str(ticket_number)].get("creator_id"))
-    closer = interaction.guild.get_member(ticket_data[str(ticket_number)].get("closer_id"))
+    creator = await member_resolver.get(interaction.guild, ticket_data[str(ticket_number)].get("creator_id"))
+    closer = await member_resolver.get(interaction.guild, ticket_data[str(ticket_number)].get("closer_id"))
     creator_text = creator.display_name if creator else "N/A"
     closer_text = closer.display_name if closer else "N/A"
 
@@ -931,7 +2441,7 @@ async def unclaim_ticket(interaction: discord.Interaction):
         "Unclaimed By": f"{interaction.user.display_name}",
         "Ticket": f"ticket-{ticket_number}",
         "Channel": interaction.channel.mention
-    }, ticket_info.get("ticket_log_channel_id"))
+    }, ticket_setting(ticket_info, "ticket_log_channel_id"))
 
     embed = discord.Embed(
         description=f"This ticket has been unclaimed by {interaction.user.display_name}.",
@@ -941,20 +2451,20 @@ async def unclaim_ticket(interaction: discord.Interaction):
     await interaction.followup.send("You have unclaimed this ticket.", ephemeral=True)
 
 @client.tree.command(name="claim", description="Claim a ticket (staff only)")
+@profiled("command:claim", operation="claim")
 async def claim_ticket(interaction: discord.Interaction):
-    if not interaction.channel.name.startswith("ticket-"):
+    ticket_number, ticket_info = ticket_for_channel(interaction.channel)
+    if not ticket_info or ticket_info.get("closer_id"):
         await interaction.response.send_message("This command can only be used in a ticket channel.", ephemeral=True)
         return
 
-    ticket_number = interaction.channel.name.split("-")[-1]
-    ticket_info = ticket_data.get(str(ticket_number), {})
     staff_role = interaction.guild.get_role(ticket_info.get("staff_role_id"))
     if not staff_role or staff_role not in interaction.user.roles:
         await interaction.response.send_message("You do not have permission to claim this ticket. This action is restricted to staff members only.", ephemeral=True)
         return
 
     if "claimer_id" in ticket_info:
-        claimer = interaction.guild.get_member(ticket_info["claimer_id"])
+        claimer = await member_resolver.get(interaction.guild, ticket_info["claimer_id"])
         embed = discord.Embed(
             description=f"This ticket has already been claimed by {claimer.display_name}.",
             color=discord.Color.red()
@@ -963,26 +2473,20 @@ async def claim_ticket(interaction: discord.Interaction):
         return
 
     ticket_data[str(ticket_number)]["claimer_id"] = interaction.user.id
-    save_ticket_data(ticket_data)
+    save_ticket_data(ticket_data, ticket_number)
 
     overwrites = interaction.channel.overwrites
-    for member in interaction.guild.members:
-        if staff_role in member.roles and member.id != interaction.user.id:
-            if not any(role.permissions.administrator for role in member.roles):
-                overwrites[member] = discord.PermissionOverwrite(view_channel=False)
-    overwrites[interaction.user] = discord.PermissionOverwrite(view_channel=True, send_messages=True)
-    creator_id = ticket_data[str(ticket_number)].get("creator_id")
-    if creator_id:
-        overwrites[interaction.guild.get_member(creator_id)] = discord.PermissionOverwrite(view_channel=True, send_messages=True)
+    hide_from_staff(overwrites, interaction.guild, staff_role, interaction.user)
+    creator = await member_resolver.get(interaction.guild, ticket_data[str(ticket_number)].get("creator_id"))
+    if creator:
+        overwrites[creator] = discord.PermissionOverwrite(view_channel=True, send_messages=True)
     await interaction.channel.edit(overwrites=overwrites)
 
     embed = discord.Embed(description=f"This ticket has been claimed by {interaction.user.display_name}.", color=discord.Color.gold())
     await interaction.channel.send(embed=embed)
 
-    creator = interaction.guild.get_member(ticket_data[str(ticket_number)].get("creator_id"))
-    claimer = interaction.guild.get_member(ticket_data[str(ticket_number)].get("claimer_id"))
     creator_text = creator.display_name if creator else "N/A"
-    claimer_text = claimer.display_name if claimer else "N/A"
+    claimer_text = interaction.user.display_name
 
     await log_action(interaction.client, f"Ticket Claimed", {
         "Created By": creator_text,
@@ -990,18 +2494,18 @@ async def claim_ticket(interaction: discord.Interaction):
         "Closed By": "N/A",
         "Ticket": f"ticket-{ticket_number}",
         "Channel": interaction.channel.mention
-    }, ticket_info.get("ticket_log_channel_id"))
+    }, ticket_setting(ticket_info, "ticket_log_channel_id"))
     await interaction.response.send_message("You have claimed this ticket!", ephemeral=True)
 
 @client.tree.command(name="close", description="Close a ticket (staff or ticket creator only)")
 @app_commands.describe(ticket="The ticket channel to close")
+@profiled("command:close")
 async def close_ticket(interaction: discord.Interaction, ticket: discord.TextChannel):
-    if not ticket.name.startswith("ticket-"):
+    ticket_number, ticket_info = ticket_for_channel(ticket)
+    if not ticket_info or ticket_info.get("closer_id"):
         await interaction.response.send_message("This channel is not an open ticket.", ephemeral=True)
         return
 
-    ticket_number = ticket.name.split("-")[-1]
-    ticket_info = ticket_data.get(ticket_number, {})
     ticket_creator_id = ticket_info.get("creator_id")
 
     if not ticket_creator_id:
@@ -1019,23 +2523,22 @@ async def close_ticket(interaction: discord.Interaction, ticket: discord.TextCha
         description=f"Confirm closing ticket-{ticket_number}?",
         color=discord.Color.orange()
     )
-    view = ConfirmCloseView(ticket_creator_id, ticket_number, ticket, ticket_info.get("staff_role_id"), ticket_info.get("ticket_log_channel_id"))
-    message = await ticket.send(embed=embed, view=view)
+    message = await ticket.send(embed=embed, view=render_only(ConfirmCloseView()))
     confirmation_buttons = ["Proceed", "Abort"]
     ticket_data[ticket_number]["confirmation_message_id"] = str(message.id)
     ticket_data[ticket_number]["confirmation_message_buttons"] = confirmation_buttons
-    save_ticket_data(ticket_data)
+    save_ticket_data(ticket_data, ticket_number)
     logger.debug(f"Stored confirmation buttons for ticket {ticket_number}: {confirmation_buttons}")
 
 @client.tree.command(name="add", description="Add a user or role to the ticket (staff only)")
 @app_commands.describe(user="The user to add to the ticket", role="The role to add to the ticket")
+@profiled("command:add")
 async def add_to_ticket(interaction: discord.Interaction, user: discord.Member = None, role: discord.Role = None):
-    if not interaction.channel.name.startswith(("ticket-", "closed-ticket-")):
+    ticket_number, ticket_info = ticket_for_channel(interaction.channel)
+    if not ticket_info:
         await interaction.response.send_message("This command can only be used in a ticket channel.", ephemeral=True)
         return
 
-    ticket_number = interaction.channel.name.split("-")[-1]
-    ticket_info = ticket_data.get(str(ticket_number), {})
     staff_role = interaction.guild.get_role(ticket_info.get("staff_role_id"))
     if not staff_role or staff_role not in interaction.user.roles:
         await interaction.response.send_message("You do not have permission to use this command. This action is restricted to staff members only.", ephemeral=True)
@@ -1059,7 +2562,7 @@ async def add_to_ticket(interaction: discord.Interaction, user: discord.Member =
             "User": user.display_name,
             "Ticket": f"ticket-{ticket_number}",
             "Channel": interaction.channel.mention
-        }, ticket_info.get("ticket_log_channel_id"))
+        }, ticket_setting(ticket_info, "ticket_log_channel_id"))
     if role:
         overwrites[role] = discord.PermissionOverwrite(view_channel=True, send_messages=True)
         await interaction.channel.send(f"{interaction.user.mention} has added {role.mention} to the ticket!")
@@ -1068,19 +2571,19 @@ async def add_to_ticket(interaction: discord.Interaction, user: discord.Member =
             "Role": role.name,
             "Ticket": f"ticket-{ticket_number}",
             "Channel": interaction.channel.mention
-        }, ticket_info.get("ticket_log_channel_id"))
+        }, ticket_setting(ticket_info, "ticket_log_channel_id"))
     await interaction.channel.edit(overwrites=overwrites)
     await interaction.response.send_message(f"{'User' if user else ''}{' and role' if user and role else 'Role' if role else ''} added to the ticket!", ephemeral=True)
 
 @client.tree.command(name="remove", description="Remove a user or role from the ticket (staff only)")
 @app_commands.describe(user="The user to remove from the ticket", role="The role to remove from the ticket")
+@profiled("command:remove")
 async def remove_from_ticket(interaction: discord.Interaction, user: discord.Member = None, role: discord.Role = None):
-    if not interaction.channel.name.startswith(("ticket-", "closed-ticket-")):
+    ticket_number, ticket_info = ticket_for_channel(interaction.channel)
+    if not ticket_info:
         await interaction.response.send_message("This command can only be used in a ticket channel.", ephemeral=True)
         return
 
-    ticket_number = interaction.channel.name.split("-")[-1]
-    ticket_info = ticket_data.get(str(ticket_number), {})
     staff_role = interaction.guild.get_role(ticket_info.get("staff_role_id"))
     if not staff_role or staff_role not in interaction.user.roles:
         await interaction.response.send_message("You do not have permission to use this command. This action is restricted to staff members only.", ephemeral=True)
@@ -1107,12 +2610,17 @@ async def remove_from_ticket(interaction: discord.Interaction, user: discord.Mem
             "User": user.display_name,
             "Ticket": f"ticket-{ticket_number}",
             "Channel": interaction.channel.mention
-        }, ticket_info.get("ticket_log_channel_id"))
+        }, ticket_setting(ticket_info, "ticket_log_channel_id"))
     if role:
         if role.id == staff_role.id:
-            for member in interaction.guild.members:
-                if member.id != interaction.user.id and staff_role in member.roles:
-                    overwrites.pop(member, None)
+            if interaction.guild.chunked:
+                for member in staff_members(interaction.guild, staff_role):
+                    if member.id != interaction.user.id:
+                        overwrites.pop(member, None)
+            else:
+                # Same as hide_from_staff: without the member cache the role's members cannot be
+                # listed, so the staff role itself is denied
+                overwrites[staff_role] = discord.PermissionOverwrite(view_channel=False)
             overwrites[interaction.user] = discord.PermissionOverwrite(view_channel=True, send_messages=True)
         else:
             overwrites.pop(role, None)
@@ -1122,7 +2630,7 @@ async def remove_from_ticket(interaction: discord.Interaction, user: discord.Mem
             "Role": role.name,
             "Ticket": f"ticket-{ticket_number}",
             "Channel": interaction.channel.mention
-        }, ticket_info.get("ticket_log_channel_id"))
+        }, ticket_setting(ticket_info, "ticket_log_channel_id"))
     await interaction.channel.edit(overwrites=overwrites)
     await interaction.response.send_message(f"{'User' if user else ''}{' and role' if user and role else 'Role' if role else ''} removed from the ticket!", ephemeral=True)
 
@@ -1144,12 +2652,51 @@ async def on_app_command_error(interaction: discord.Interaction, error: app_comm
 client.tree.on_error = on_app_command_error
 
 @client.event
-async def on_message(message):
-    pass
+async def on_member_join(member):
+    _update_member_roles(member.guild.id, member.id, set(), {role.id for role in member.roles})
+
+@client.event
+async def on_member_remove(member):
+    _update_member_roles(member.guild.id, member.id, {role.id for role in member.roles}, set())
+
+@client.event
+async def on_member_update(before, after):
+    if before.roles != after.roles:
+        _update_member_roles(after.guild.id, after.id, {role.id for role in before.roles}, {role.id for role in after.roles})
+
+@client.event
+async def on_guild_role_update(before, after):
+    if before.permissions.administrator != after.permissions.administrator:
+        admin_cache.pop(after.guild.id, None)
+
+@client.event
+async def on_guild_role_delete(role):
+    role_members.get(role.guild.id, {}).pop(role.id, None)
+    admin_cache.pop(role.guild.id, None)
+
+@client.event
+async def setup_hook():
+    persistence.start()
+    if LOOP_WATCHDOG_ENABLED:
+        loop_watchdog.start()
+    job_queue.start()
+    # Persistent views: one instance each handles every panel and ticket button, including ones
+    # sent before the last restart
+    client.add_view(SupportView())
+    client.add_view(TicketView())
+    client.add_view(ConfirmCloseView())
+    if TRANSCRIPT_SERVER_BACKEND == "aiohttp" and is_primary_process():
+        client.transcript_server = await start_transcript_server()
 
 @client.event
 async def on_ready():
     print(f'{client.user} has connected to Discord!')
+    if any(not ticket_info.get("channel_id") for ticket_info in ticket_data.values()):
+        for guild in client.guilds:
+            backfill_ticket_channels(guild)
+    if not is_primary_process():
+        # Commands are global; the process running shard 0 syncs them for everyone
+        return
     try:
         synced = await client.tree.sync()
         print(f"Synced {len(synced)} commands: {', '.join(cmd.name for cmd in synced)}")
@@ -1158,14 +2705,29 @@ async def on_ready():
         print(f"Error syncing commands: {e}")
         logger.error(f"Error syncing commands: {e}")
 
+def transcript_server_port():
+    # TODO: Replace YOUR_PORT with the port number you want the transcript server to run on
+    return YOUR_PORT
+
 def run_flask():
-    # TODO: Replace YOUR_PORT with the port number you want the Flask server to run on
-    app.run(host='0.0.0.0', port=YOUR_PORT, debug=False)
+    app.run(host='0.0.0.0', port=transcript_server_port(), debug=False)
+
+async def start_transcript_server():
+    runner = web.AppRunner(make_transcript_web_app(), keepalive_timeout=TRANSCRIPT_SERVER_KEEPALIVE_TIMEOUT, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host='0.0.0.0', port=transcript_server_port(), backlog=1024)
+    await site.start()
+    logger.info(f"Transcript server listening on port {transcript_server_port()}")
+    return runner
 
 if __name__ == "__main__":
-    flask_thread = threading.Thread(target=run_flask, daemon=True)
-    flask_thread.start()
+    if TRANSCRIPT_SERVER_BACKEND == "flask" and is_primary_process():
+        flask_thread = threading.Thread(target=run_flask, daemon=True)
+        flask_thread.start()
     # Ensure you have a token.txt file with your Discord bot token
     with open("token.txt", "r") as f:
         token = f.read().strip()
-    client.run(token)
\ No newline at end of file
+    try:
+        client.run(token)
+    finally:
+        persistence.flush()
\ No newline at end of file
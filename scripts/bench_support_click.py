@@ -0,0 +1,61 @@
+# Times SupportButton.callback with growing numbers of historical (closed) tickets on record. The
+# duplicate-ticket check and channel lookups go through the open-ticket indexes, so click latency
+# should stay flat from 100 to 500,000 historical tickets.
+#
+# Run from the repository root: python scripts/bench_support_click.py
+import asyncio
+import logging
+import statistics
+import time
+
+from bot_fakes import load_bot, make_guild, make_interaction
+
+HISTORY_SIZES = (100, 1_000, 10_000, 100_000, 500_000)
+CLICKS = 500
+GUILD_ID = 4242
+PANEL_CHANNEL_ID = 10
+STAFF_ROLE_ID = 20
+
+main = load_bot()
+logging.disable(logging.CRITICAL)
+
+def fill_history(size):
+    # Closed tickets from many creators across a few guilds, as a long-running bot accumulates them
+    main.ticket_data.clear()
+    for number in range(1, size + 1):
+        main.ticket_data[str(number)] = {
+            "creator_id": 100_000 + number % 50_000,
+            "guild_id": GUILD_ID + number % 4,
+            "channel_id": 10_000_000 + number,
+            "staff_role_id": STAFF_ROLE_ID,
+            "closer_id": 1
+        }
+    main.ticket_counter = size
+    main.save_ticket_data(main.ticket_data)
+
+async def time_clicks(first_user_id):
+    guild = make_guild(GUILD_ID, STAFF_ROLE_ID)
+    button = main.SupportButton()
+    timings = []
+    for user_id in range(first_user_id, first_user_id + CLICKS):
+        interaction = make_interaction(guild, PANEL_CHANNEL_ID, user_id)
+        started = time.perf_counter()
+        await button.callback(interaction)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+async def run():
+    main.support_panel_data[str(GUILD_ID)] = {
+        str(PANEL_CHANNEL_ID): {"staff_role_id": STAFF_ROLE_ID, "ticket_category_id": None}
+    }
+    print(f"{'historical tickets':>18}  {'median ms':>9}  {'p95 ms':>7}")
+    for size in HISTORY_SIZES:
+        fill_history(size)
+        # Clicking users have no open ticket, so every click creates one
+        timings = sorted(await time_clicks(first_user_id=1))
+        median = statistics.median(timings) * 1000
+        p95 = timings[int(len(timings) * 0.95)] * 1000
+        print(f"{size:>18,}  {median:>9.3f}  {p95:>7.3f}")
+
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -0,0 +1,49 @@
+# Times generate_transcript on a synthetic mention-heavy ticket: 2,000 messages with 100 user and
+# role mentions each. Pass an older main.py to compare against it, e.g. the one from before mentions
+# were rewritten in a single pass:
+#   git show 6775b86^:main.py > /tmp/main_before.py
+#   python scripts/bench_transcript_mentions.py /tmp/main_before.py
+#
+# Run from the repository root: python scripts/bench_transcript_mentions.py [path to main.py]
+import asyncio
+import logging
+import random
+import sys
+import time
+
+from bot_fakes import load_bot, make_guild, make_member, make_ticket_channel
+
+MESSAGES = 2000
+MENTIONS_PER_MESSAGE = 100
+MEMBERS = 50
+RUNS = 3
+GUILD_ID = 4242
+STAFF_ROLE_ID = 20
+
+main = load_bot(sys.argv[1] if len(sys.argv) > 1 else None)
+logging.disable(logging.CRITICAL)
+
+def mention_heavy_contents():
+    # Staff tickets ping the same handful of people and the staff role over and over
+    mentions = [f"<@{member_id}>" for member_id in range(1, MEMBERS + 1)]
+    mentions += [f"<@!{member_id}>" for member_id in range(1, MEMBERS + 1)]
+    mentions += [f"<@&{STAFF_ROLE_ID}>", "<@999999>"]
+    return [" ".join(f"{random.choice(mentions)} see above" for _ in range(MENTIONS_PER_MESSAGE)) for _ in range(MESSAGES)]
+
+async def run():
+    random.seed(0)
+    members = [make_member(member_id) for member_id in range(1, MEMBERS + 1)]
+    guild = make_guild(GUILD_ID, STAFF_ROLE_ID, members=members)
+    contents = mention_heavy_contents()
+    timings = []
+    for _ in range(RUNS):
+        channel = make_ticket_channel(guild, "ticket-1", contents, members[:2])
+        writer = main.transcript_archive.writer()
+        started = time.perf_counter()
+        await main.generate_transcript(channel, "1", writer)
+        timings.append(time.perf_counter() - started)
+        writer.abort()
+    print(f"{MESSAGES} messages x {MENTIONS_PER_MESSAGE} mentions: best {min(timings):.3f}s of {RUNS} runs")
+
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -0,0 +1,68 @@
+# Measures transcript page requests per second: archives one synthetic ticket transcript, then
+# requests its page repeatedly through Flask's test client, and through the aiohttp server when
+# main.py has one. Pass an older main.py to compare against it, e.g. the one from before pages
+# were pre-rendered at close:
+#   git show 6690fbd^:main.py > /tmp/main_before.py
+#   python scripts/bench_transcript_route.py /tmp/main_before.py
+#
+# Run from the repository root: python scripts/bench_transcript_route.py [path to main.py]
+import asyncio
+import logging
+import sys
+import time
+
+from bot_fakes import load_bot, make_guild, make_member, make_ticket_channel
+
+MESSAGES = 500
+REQUESTS = 2000
+TICKET_NUMBER = "1"
+TOKEN = "benchmark-token"
+GUILD_ID = 4242
+STAFF_ROLE_ID = 20
+
+main = load_bot(sys.argv[1] if len(sys.argv) > 1 else None)
+logging.disable(logging.CRITICAL)
+
+async def archive_transcript():
+    authors = [make_member(1), make_member(2)]
+    guild = make_guild(GUILD_ID, STAFF_ROLE_ID, members=authors)
+    contents = [f"Message {index} from <@{index % 2 + 1}> about the ticket" for index in range(MESSAGES)]
+    channel = make_ticket_channel(guild, f"closed-ticket-{TICKET_NUMBER}", contents, authors)
+    main.ticket_data[TICKET_NUMBER] = {"creator_id": 1, "guild_id": GUILD_ID, "channel_id": channel.id, "closer_id": 2}
+    writer = main.transcript_archive.writer()
+    stats = await main.generate_transcript(channel, TICKET_NUMBER, writer)
+    main.transcript_archive.add(TICKET_NUMBER, writer.finish(stats), TOKEN, 1)
+
+def bench_flask():
+    client = main.app.test_client()
+    url = f"/transcript/{TICKET_NUMBER}?token={TOKEN}"
+    assert client.get(url).status_code == 200  # The first view renders pages archived without one
+    started = time.perf_counter()
+    for _ in range(REQUESTS):
+        client.get(url, headers={"Accept-Encoding": "gzip"}).close()
+    return REQUESTS / (time.perf_counter() - started)
+
+async def bench_aiohttp(concurrency=50):
+    from aiohttp.test_utils import TestClient, TestServer
+    url = f"/transcript/{TICKET_NUMBER}?token={TOKEN}"
+    async with TestClient(TestServer(main.make_transcript_web_app())) as client:
+        assert (await client.get(url)).status == 200
+
+        async def fetch(count):
+            for _ in range(count):
+                async with client.get(url) as response:
+                    await response.read()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(fetch(REQUESTS // concurrency) for _ in range(concurrency)))
+        return REQUESTS / (time.perf_counter() - started)
+
+def run():
+    asyncio.run(archive_transcript())
+    print(f"{MESSAGES}-message transcript, {REQUESTS} requests")
+    print(f"flask:   {bench_flask():8.0f} requests/s")
+    if hasattr(main, "make_transcript_web_app"):
+        print(f"aiohttp: {asyncio.run(bench_aiohttp()):8.0f} requests/s")
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,83 @@
+# Fake Discord objects and a bot loader shared by the scripts in this directory. Nothing here talks to
+# Discord, and the bot's data files are created in a temporary directory, never in the working tree.
+import asyncio
+import datetime
+import importlib.util
+import os
+import random
+import sys
+import tempfile
+from types import SimpleNamespace
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load_bot(path=None):
+    # Imports main.py, or another revision of it for before/after comparisons, e.g.
+    # git show <commit>:main.py > /tmp/main_before.py
+    path = os.path.abspath(path or os.path.join(REPO_ROOT, "main.py"))
+    os.chdir(tempfile.mkdtemp(prefix="ticket-bot-script-"))
+    spec = importlib.util.spec_from_file_location("main", path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["main"] = module
+    spec.loader.exec_module(module)
+    return module
+
+class Fake(SimpleNamespace):
+    # Members and roles are used as permission overwrite keys, so they must be hashable
+    __hash__ = object.__hash__
+
+async def noop(*args, **kwargs):
+    return SimpleNamespace(id=random.randrange(1 << 40))
+
+def make_guild(guild_id, staff_role_id, outcomes=None, channel_delay=0.0, members=()):
+    # outcomes maps channel names to "http_error" or "error" for create_text_channel to fail with
+    import discord
+    staff_role = Fake(id=staff_role_id, name="Staff", mention="@Staff", position=1, color=SimpleNamespace(value=0xFF0000))
+    members = {member.id: member for member in members}
+    channels = {}
+
+    async def create_text_channel(name, **kwargs):
+        if channel_delay:
+            await asyncio.sleep(random.uniform(0, channel_delay))
+        outcome = (outcomes or {}).get(name, "ok")
+        if outcome == "http_error":
+            raise discord.HTTPException(SimpleNamespace(status=500, reason="Internal Server Error"), "create failed")
+        if outcome == "error":
+            raise AttributeError("simulated failure")
+        channel = SimpleNamespace(id=len(channels) + 1000, name=name, mention=f"#{name}", send=noop)
+        channels[name] = channel
+        return channel
+
+    guild = SimpleNamespace(
+        id=guild_id, name="Test Guild", default_role="everyone", me="me", chunked=True, channels=channels,
+        get_role=lambda role_id: staff_role if role_id == staff_role_id else None,
+        get_member=members.get, get_channel=lambda channel_id: None, create_text_channel=create_text_channel
+    )
+    return guild
+
+def make_member(member_id, roles=()):
+    return Fake(
+        id=member_id, display_name=f"user{member_id}", mention=f"<@{member_id}>", roles=list(roles),
+        avatar=None, default_avatar=SimpleNamespace(url=f"https://cdn.example/{member_id}.png")
+    )
+
+def make_interaction(guild, channel_id, user_id):
+    return SimpleNamespace(
+        guild=guild, channel=SimpleNamespace(id=channel_id), user=make_member(user_id),
+        client=SimpleNamespace(get_channel=lambda channel_id: None),
+        response=SimpleNamespace(defer=noop), followup=SimpleNamespace(send=noop)
+    )
+
+def make_ticket_channel(guild, name, contents, authors):
+    # A ticket channel whose history() yields one message per entry of contents, from authors in turn
+    import discord
+    started = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+    async def history(limit=None, oldest_first=False):
+        for index, content in enumerate(contents):
+            yield SimpleNamespace(
+                id=index, created_at=started + datetime.timedelta(seconds=index), type=discord.MessageType.default,
+                content=content, author=authors[index % len(authors)], embeds=[], components=[]
+            )
+
+    return SimpleNamespace(id=random.randrange(1 << 40), name=name, mention=f"#{name}", guild=guild, history=history, send=noop)
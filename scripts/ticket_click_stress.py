@@ -0,0 +1,51 @@
+# Fires 300 concurrent "Create Support Ticket" clicks at SupportButton.callback against fake Discord
+# objects and checks that no ticket number is handed out twice, that nobody ends up with two open
+# tickets, and that clicks whose channel could not be created (API error, unexpected exception or
+# cancellation) give their reservation back.
+#
+# Run from the repository root: python scripts/ticket_click_stress.py
+import asyncio
+import random
+from collections import Counter
+
+from bot_fakes import load_bot, make_guild, make_interaction
+
+CLICKS = 300
+USERS = 120
+GUILD_ID = 4242
+PANEL_CHANNEL_ID = 10
+STAFF_ROLE_ID = 20
+
+main = load_bot()
+
+async def run():
+    main.support_panel_data[str(GUILD_ID)] = {
+        str(PANEL_CHANNEL_ID): {"staff_role_id": STAFF_ROLE_ID, "ticket_category_id": None}
+    }
+    # Ticket numbers are only known once reserved, so failures are assigned by channel name up front
+    outcomes = {}
+    for number in range(main.ticket_counter + 1, main.ticket_counter + CLICKS + 1):
+        outcomes[f"ticket-{number}"] = random.choices(["ok", "http_error", "error"], [8, 1, 1])[0]
+    guild = make_guild(GUILD_ID, STAFF_ROLE_ID, outcomes, channel_delay=0.02)
+    channels = guild.channels
+    button = main.SupportButton()
+
+    clicks = [asyncio.create_task(button.callback(make_interaction(guild, PANEL_CHANNEL_ID, random.randint(1, USERS)))) for _ in range(CLICKS)]
+    for task in random.sample(clicks, CLICKS // 20):
+        task.cancel()
+    results = await asyncio.gather(*clicks, return_exceptions=True)
+    unexpected = [result for result in results if isinstance(result, Exception) and not isinstance(result, AttributeError)]
+    assert not unexpected, f"unexpected errors: {unexpected[:3]}"
+
+    tickets = {number: info for number, info in main.ticket_data.items() if info.get("guild_id") == GUILD_ID}
+    assert all(info.get("channel_id") for info in tickets.values()), "a reservation without a channel was left behind"
+    assert len(tickets) == len(channels), f"{len(tickets)} tickets for {len(channels)} channels"
+    assert len({info["channel_id"] for info in tickets.values()}) == len(tickets), "two tickets share a channel"
+    per_user = Counter(info["creator_id"] for info in tickets.values())
+    assert max(per_user.values(), default=0) <= 1, f"users with more than one open ticket: {[u for u, n in per_user.items() if n > 1]}"
+    for info in tickets.values():
+        assert main.find_open_ticket(GUILD_ID, info["creator_id"]) is not None
+    print(f"{CLICKS} clicks from {USERS} users: {len(tickets)} tickets created, numbers and open-ticket slots unique")
+
+if __name__ == "__main__":
+    asyncio.run(run())